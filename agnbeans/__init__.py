@@ -0,0 +1,47 @@
+"""
+AGN-BEANS helper modules.
+
+The AGN-BEANS-Full and AGN-BEANS-SimOnly scripts import from here. Run them
+from the repository folder so Python can find this package.
+
+The stages can also be used without the scripts:
+
+    from agnbeans import RunConfig, simulate, extract, spectra
+    cfg = RunConfig(BHM=5e7, N_testparticle=2000)
+    simulate(cfg, "run"); extract(cfg, "run"); spectra(cfg, "run")
+
+or from the command line with python -m agnbeans (see cli.py). The names
+below are imported on first use, so importing the package does not load
+rebound, scipy, astropy, pandas or matplotlib.
+"""
+
+import importlib
+
+
+_EXPORTS = {
+    'RunConfig': 'agnbeans.config',
+    'simulate': 'agnbeans.pipeline',
+    'extract': 'agnbeans.pipeline',
+    'spectra': 'agnbeans.pipeline',
+    'observer_spectra': 'agnbeans.pipeline',
+    'run_cached': 'agnbeans.pipeline',
+    'run_dirs': 'agnbeans.pipeline',
+    'ProductCache': 'agnbeans.cache',
+    'ObserverGrid': 'agnbeans.observers',
+    'run_sweep': 'agnbeans.sweep',
+    'run_ensemble': 'agnbeans.ensemble',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'agnbeans' has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
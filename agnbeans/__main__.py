@@ -0,0 +1,6 @@
+import sys
+
+from agnbeans.cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Animations straight from the phase-space cube.
+
+Each frame shows the XY, YZ and XZ projections side by side as 2D
+histogram rasters, binned with one bincount per panel instead of drawing a
+scatter point per particle, so the cost hardly depends on the number of
+particles and dense regions do not saturate. Pixels are coloured by
+
+    count       log10 of the number of clouds
+    luminosity  log10 of the summed cloud luminosity
+    velocity    mean out-of-plane velocity (Vz for XY, Vx for YZ, Vy for
+                XZ, as in the scatter frames), symmetric about 0
+
+with the extent and colour range fixed over the whole run so frames do not
+flicker. Frames are 8-bit palette images (index 0 background, 1 markers
+and text, 2-255 the colormap); they are rendered in a process pool and
+written in order as they arrive, to a GIF with Pillow or to a video
+through an ffmpeg pipe, so no frame is ever stored as a JPEG and only a
+few are held in memory.
+"""
+
+import os
+import shutil
+import subprocess
+
+import numpy as np
+
+from agnbeans.parallel import process_pool
+
+
+WEIGHTS = ('count', 'luminosity', 'velocity')
+
+# (horizontal axis, vertical axis, colour velocity) columns of each panel
+PANELS = {'XY': (0, 1, 5), 'YZ': (2, 1, 3), 'XZ': (0, 2, 4)}
+
+GAP = 4                         # Background pixels between panels
+
+
+def frame_extent(cube, percentile=99.5):
+    """
+    Half-width in cm of the square panels: the given percentile of the
+    largest |x|, |y| or |z| of the test particles over every snapshot.
+    """
+    reach = np.abs(cube[:, 1:, :3]).max(axis=2)
+    return float(np.percentile(reach, percentile))
+
+
+def colormap_palette(name):
+    """
+    The 768 byte palette of the frames: white background, black markers
+    and 254 colours of the matplotlib colormap name.
+    """
+    import matplotlib
+    colours = matplotlib.colormaps[name](np.linspace(0, 1, 254))[:, :3]
+    lut = np.vstack([[1, 1, 1], [0, 0, 0], colours])
+    return np.round(lut * 255).astype(np.uint8)
+
+
+class RasterRenderer:
+    """
+    Turns (N+1, 6) snapshots into palette frames. extent is the panel
+    half-width in cm and vrange the top of the colour scale: a velocity in
+    cm/s for 'velocity', or the largest count or luminosity of a pixel.
+    """
+
+    def __init__(self, extent, vrange, weight='velocity', bins=300, decades=4):
+        if weight not in WEIGHTS:
+            raise ValueError(f"Unknown weight {weight!r}, use one of {WEIGHTS}")
+        self.extent = extent
+        self.vrange = vrange
+        self.weight = weight
+        self.bins = bins
+        self.decades = decades
+        self.shape = (bins, 3 * bins + 2 * GAP)
+
+    def _bin(self, px, py):
+        """
+        Flat pixel index of every point (row 0 at the top), -1 outside.
+        """
+        scale = self.bins / (2 * self.extent)
+        col = np.floor((px + self.extent) * scale).astype(np.int64)
+        row = self.bins - 1 - np.floor((py + self.extent) * scale).astype(np.int64)
+        inside = (col >= 0) & (col < self.bins) & (row >= 0) & (row < self.bins)
+        return np.where(inside, row * self.bins + col, -1)
+
+    def _levels(self, values, filled):
+        """
+        Palette indices 2-255 of the pixel values, 0 for empty pixels.
+        """
+        if self.weight == 'velocity':
+            scaled = 0.5 + 0.5 * values / self.vrange
+        else:
+            with np.errstate(divide='ignore'):
+                scaled = 1 + np.log10(values / self.vrange) / self.decades
+        scaled = np.clip(np.nan_to_num(scaled), 0, 1)
+        levels = 2 + np.round(scaled * 253).astype(np.uint8)
+        return np.where(filled, levels, 0).astype(np.uint8)
+
+    def panel(self, coords, name, Lvals=None):
+        """
+        (bins, bins) palette indices of one projection.
+        """
+        h, v, colour = PANELS[name]
+        rel = coords[1:]
+        pixel = self._bin(rel[:, h], rel[:, v])
+        inside = pixel >= 0
+        pixel = pixel[inside]
+        size = self.bins**2
+
+        count = np.bincount(pixel, minlength=size)
+        if self.weight == 'count':
+            values = count
+        elif self.weight == 'luminosity':
+            values = np.bincount(pixel, weights=Lvals[inside], minlength=size)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = np.bincount(pixel, weights=rel[inside, colour], minlength=size) / count
+
+        image = self._levels(values, count > 0).reshape(self.bins, self.bins)
+
+        # Central mass
+        bh = self._bin(coords[:1, h], coords[:1, v])[0]
+        if bh >= 0:
+            r, c = divmod(bh, self.bins)
+            image[max(r - 3, 0):r + 4, c] = 1
+            image[r, max(c - 3, 0):c + 4] = 1
+        return image
+
+    def render(self, coords, t=None, Lvals=None):
+        """
+        One (bins, 3 bins + gaps) frame of the three panels, labelled with
+        the time t in seconds.
+        """
+        frame = np.zeros(self.shape, dtype=np.uint8)
+        for k, name in enumerate(PANELS):
+            left = k * (self.bins + GAP)
+            frame[:, left:left + self.bins] = self.panel(coords, name, Lvals)
+
+        from PIL import Image, ImageDraw
+        image = Image.fromarray(frame, mode='P')
+        draw = ImageDraw.Draw(image)
+        for k, name in enumerate(PANELS):
+            draw.text((k * (self.bins + GAP) + 4, 2), name, fill=1)
+        if t is not None:
+            draw.text((4, self.bins - 14), f"t = {t:.3e} s", fill=1)
+        return np.asarray(image)
+
+
+# =============================================================================
+# WRITERS
+# =============================================================================
+
+class GifWriter:
+    """
+    Writes palette frames to an animated GIF one at a time.
+    """
+
+    def __init__(self, path, palette, fps=15, loop=0):
+        from PIL import GifImagePlugin
+        self.plugin = GifImagePlugin
+        self.palette = palette.tobytes()
+        self.duration = int(round(1000 / fps))
+        self.loop = loop
+        self.file = open(path, "wb")
+        self.started = False
+
+    def _image(self, frame):
+        from PIL import Image
+        image = Image.fromarray(frame, mode='P')
+        image.putpalette(self.palette)
+        return image
+
+    def write(self, frame):
+        image = self._image(frame)
+        if not self.started:
+            header, _ = self.plugin.getheader(image, self.palette,
+                                              {'loop': self.loop, 'duration': self.duration})
+            for chunk in header:
+                self.file.write(chunk)
+            self.started = True
+        for chunk in self.plugin.getdata(image, duration=self.duration):
+            self.file.write(chunk)
+
+    def close(self):
+        self.file.write(b";")     # GIF trailer
+        self.file.close()
+
+
+class VideoWriter:
+    """
+    Pipes RGB frames to ffmpeg, which must be on the PATH, and encodes
+    them with the codec ffmpeg picks for the file extension.
+    """
+
+    def __init__(self, path, palette, shape, fps=15):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("Writing video needs ffmpeg on the PATH, use a .gif file instead")
+        self.palette = palette
+        # Most codecs need even dimensions
+        self.height, self.width = shape[0] + shape[0] % 2, shape[1] + shape[1] % 2
+        self.process = subprocess.Popen(
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+             "-s", f"{self.width}x{self.height}", "-r", str(fps), "-i", "-",
+             "-pix_fmt", "yuv420p", path],
+            stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        rgb = np.full((self.height, self.width, 3), 255, dtype=np.uint8)
+        rgb[:frame.shape[0], :frame.shape[1]] = self.palette[frame]
+        self.process.stdin.write(rgb.tobytes())
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg failed to encode the animation")
+
+
+def open_writer(path, palette, shape, fps=15):
+    """
+    GifWriter for .gif paths, VideoWriter for anything else (.mp4, ...).
+    """
+    if os.path.splitext(path)[1].lower() == ".gif":
+        return GifWriter(path, palette, fps)
+    return VideoWriter(path, palette, shape, fps)
+
+
+# =============================================================================
+# ENCODING
+# =============================================================================
+
+_renderer = None
+
+
+def _init_worker(renderer):
+    global _renderer
+    _renderer = renderer
+
+
+def _render_frame(coords, t, Lvals):
+    return _renderer.render(coords, t, Lvals)
+
+
+def encode_animation(cube, times, path, weight='velocity', Lvals=None, bins=300,
+                     fps=15, cmap=None, extent=None, vrange=None, workers=2):
+    """
+    Renders every snapshot of the (S, N+1, 6) cube and encodes them to path
+    (.gif, or a video format through ffmpeg). Lvals (S, N) is needed for
+    weight='luminosity'. extent and vrange default to ranges that cover the
+    whole run. With workers=0 frames are rendered in this process.
+
+    Returns path.
+    """
+    if weight == 'luminosity' and Lvals is None:
+        raise ValueError("weight='luminosity' needs the cloud luminosities Lvals")
+    extent = extent or frame_extent(cube)
+    if vrange is None:
+        if weight == 'velocity':
+            vrange = float(np.percentile(np.abs(cube[:, 1:, 3:]), 99))
+        elif weight == 'luminosity':
+            vrange = float(np.max(Lvals)) * 10
+        else:
+            vrange = float(cube.shape[1])
+    cmap = cmap or ('coolwarm' if weight == 'velocity' else 'inferno')
+
+    renderer = RasterRenderer(extent, vrange, weight, bins)
+    writer = open_writer(path, colormap_palette(cmap), renderer.shape, fps)
+
+    def frame_args(step):
+        return np.array(cube[step]), times[step], None if Lvals is None else np.asarray(Lvals[step])
+
+    try:
+        if workers == 0:
+            for step in range(len(cube)):
+                writer.write(renderer.render(*frame_args(step)))
+        else:
+            with process_pool(workers, initializer=_init_worker, initargs=(renderer,)) as pool:
+                pending = []
+                for step in range(len(cube)):
+                    pending.append(pool.submit(_render_frame, *frame_args(step)))
+                    # Write in order, keeping a few frames in flight
+                    while len(pending) > 2 * workers:
+                        writer.write(pending.pop(0).result())
+                for future in pending:
+                    writer.write(future.result())
+    finally:
+        writer.close()
+
+    return path
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the AGN-BEANS stages.
+
+Each case builds a RunConfig with a fixed seed and a small Nimg and times
+the stages of AGN-BEANS-Full on it:
+
+    setup       building the central mass and the test particle cloud
+    step        one kicked sim.step() (best of repeat, averaged over n_steps)
+    extract     extract_archive on an archive of S snapshots
+    cloud       cloud_properties over every snapshot
+    spectrum    LoS projection and the binned_statistic line profile of
+                every snapshot and inclination
+    render      one FrameRenderer.draw
+
+setup, step and render do not depend on the snapshot count S and are run
+once per particle count. The test particles are passive (N_active = 1) and
+only feel the central mass, so the step time grows linearly in N.
+
+Every stage is timed repeat times and the fastest run is kept. A run is
+appended as one JSON line to the history file, and compared with a stored
+baseline: a result is flagged when it is slower than the baseline by more
+than tolerance.
+"""
+
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import rebound
+
+from agnbeans.cloud import cloud_properties, cloud_radius_scale
+from agnbeans.config import RunConfig, alphaB, alphaeff, c, h, nu
+from agnbeans.extraction import extract_archive
+from agnbeans.projection import ProjectionCache
+from agnbeans.simulation import apply_kick, build_simulation, run_simulation
+from agnbeans.spectra import line_profile
+
+
+HISTORY_FILE = "benchmark_history.jsonl"
+BASELINE_FILE = "benchmark_baseline.json"
+
+STAGES = ['setup', 'step', 'extract', 'cloud', 'spectrum', 'render']
+DEFAULT_SIZES = [1000, 5000, 10000, 50000]
+DEFAULT_SNAPSHOTS = [5, 15]
+
+
+def result_key(stage, N, n_snapshots=None):
+    """
+    Name of one result in the history and baseline files, e.g.
+    cloud/N=5000/S=15.
+    """
+    key = f"{stage}/N={N}"
+    if n_snapshots is not None:
+        key += f"/S={n_snapshots}"
+    return key
+
+
+def best_time(fn, repeat=3):
+    """
+    Fastest wall time of repeat calls of fn, in seconds.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def environment():
+    """
+    Host and package versions stored with every run.
+    """
+    return {
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'rebound': rebound.__version__,
+    }
+
+
+# =============================================================================
+# STAGES
+# =============================================================================
+
+def bench_size(N, snapshot_counts, repeat=3, n_steps=3, seed=42, render=True,
+               work_dir=None):
+    """
+    Times every stage for N test particles and each snapshot count.
+
+    Returns {result_key: seconds}.
+    """
+    results = {}
+    cfg = RunConfig(N_testparticle=N, RS=seed)
+
+    results[result_key('setup', N)] = best_time(lambda: build_simulation(cfg), repeat)
+
+    sim = build_simulation(cfg)
+    apply_kick(sim, cfg)
+    sim.step()                  # The first step also sets up IAS15
+
+    def steps():
+        for _ in range(n_steps):
+            apply_kick(sim, cfg)
+            sim.step()
+
+    results[result_key('step', N)] = best_time(steps, repeat) / n_steps
+
+    if render:
+        from agnbeans.render import FrameRenderer
+        renderer = FrameRenderer(cfg.KVX, cfg.KVY, cfg.KVZ)
+        coords = np.zeros((sim.N, 6))
+        sim.serialize_particle_data(xyzvxvyvz=coords)
+        tmp_dir = tempfile.mkdtemp(dir=work_dir)
+        try:
+            path = os.path.join(tmp_dir, "frame.jpg")
+            results[result_key('render', N)] = best_time(
+                lambda: renderer.draw(coords, sim.t, path), repeat)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    results.update(bench_snapshots(cfg, snapshot_counts, repeat, work_dir))
+
+    return results
+
+
+def bench_snapshots(cfg, snapshot_counts, repeat=3, work_dir=None):
+    """
+    Times extract, cloud and spectrum for each snapshot count. The run is
+    integrated once, saving every frame up to the largest count, and the
+    archive of each count is cut from it.
+
+    Returns {result_key: seconds}.
+    """
+    N = cfg.N_testparticle
+    n_max = max(snapshot_counts)
+    cfg = RunConfig(**dict(cfg.to_dict(), Nimg=n_max, timesteps=list(range(n_max))))
+    ncd, Rcld = cloud_radius_scale(cfg.N_testparticle, cfg.p, cfg.Y, cfg.Rd, cfg.Cf, cfg.alpha)
+    results = {}
+
+    tmp_dir = tempfile.mkdtemp(dir=work_dir)
+    try:
+        full_path = os.path.join(tmp_dir, "full.bin")
+        run_simulation(cfg, full_path)
+        sa = rebound.Simulationarchive(full_path)
+
+        for S in snapshot_counts:
+            archive_path = os.path.join(tmp_dir, "archive.bin")
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+            for i in range(S):
+                sa[i].save_to_file(archive_path)
+
+            results[result_key('extract', N, S)] = best_time(
+                lambda: extract_archive(archive_path, tmp_dir), repeat)
+            cube, save_times = extract_archive(archive_path, tmp_dir)
+            cube = np.array(cube)
+
+            def clouds():
+                return cloud_properties(cube, cfg.Rd, Rcld, cfg.s, cfg.n0, cfg.Q, c,
+                                        alphaB, alphaeff, h, nu)
+
+            results[result_key('cloud', N, S)] = best_time(clouds, repeat)
+            Lvals = clouds()['Lvals']
+
+            def spectrum():
+                projections = ProjectionCache(cube[:, 1:, 3:], cfg.ObsInc)
+                vel_ranges = projections.global_ranges(range(S))
+                for step in range(S):
+                    for inc in cfg.ObsInc:
+                        line_profile(projections.get(step, inc), Lvals[step],
+                                     vel_ranges[inc], cfg.numbin)
+
+            results[result_key('spectrum', N, S)] = best_time(spectrum, repeat)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return results
+
+
+def run_benchmarks(sizes=None, snapshot_counts=None, repeat=3, n_steps=3, seed=42,
+                   render=True, work_dir=None, log=print):
+    """
+    Runs every case and returns one history record: the time, the
+    environment, the suite parameters and {result_key: seconds}.
+    """
+    sizes = DEFAULT_SIZES if sizes is None else list(sizes)
+    snapshot_counts = DEFAULT_SNAPSHOTS if snapshot_counts is None else list(snapshot_counts)
+
+    results = {}
+    for N in sizes:
+        start = time.perf_counter()
+        results.update(bench_size(N, snapshot_counts, repeat, n_steps, seed, render, work_dir))
+        if log:
+            log(f"N = {N}: {time.perf_counter() - start:.1f} s")
+
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'params': {'sizes': sizes, 'snapshots': snapshot_counts, 'repeat': repeat,
+                   'n_steps': n_steps, 'seed': seed},
+        'results': results,
+    }
+
+
+# =============================================================================
+# HISTORY AND BASELINE
+# =============================================================================
+
+def append_history(out_dir, record):
+    """
+    Appends one run to out_dir/benchmark_history.jsonl.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, HISTORY_FILE), "a") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def load_history(out_dir):
+    """
+    Returns every run in the history file, oldest first.
+    """
+    path = os.path.join(out_dir, HISTORY_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_baseline(out_dir, record):
+    """
+    Stores record as the baseline later runs are compared with.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, BASELINE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(record, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_baseline(out_dir):
+    """
+    Returns the stored baseline record, or None if there is none.
+    """
+    path = os.path.join(out_dir, BASELINE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(record, baseline, tolerance=0.25, min_seconds=1e-3):
+    """
+    Compares the results of record with those of baseline.
+
+    Returns one dict per result found in both, sorted by key, with the key,
+    both times, their ratio and a regression flag. A result is a regression
+    when it is slower than baseline * (1 + tolerance) by more than
+    min_seconds, so timer noise on very short stages is not flagged.
+    """
+    rows = []
+    for key in sorted(set(record['results']) & set(baseline['results'])):
+        new, old = record['results'][key], baseline['results'][key]
+        rows.append({
+            'key': key,
+            'baseline': old,
+            'seconds': new,
+            'ratio': new / old if old > 0 else np.inf,
+            'regression': bool(new > old * (1 + tolerance) and new - old > min_seconds),
+        })
+    return rows
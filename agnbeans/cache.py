@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of derived products.
+
+Each product (the raw archive, the extracted cube, the cloud luminosities,
+the spectra) is stored under a key that hashes the stage name, the
+parameters the stage depends on and the keys of its upstream products, so
+changing ObsInc or numbin gives new spectra keys but leaves the archive key,
+and the hours of integration behind it, alone. A rerun looks every stage
+up and only recomputes the ones whose key is missing.
+
+Layout of the cache folder:
+
+    objects/{key[:2]}/{key}/    the product files and meta.json
+    tmp/                        entries being written
+    trash/                      entries being deleted
+
+An entry is written into tmp/ and renamed into objects/ with meta.json in
+it, so a crash never leaves a half-written entry under its key. meta.json
+records the size of every file; an entry whose files do not match is stale
+and is invalidated, again by renaming it out of objects/ before deleting
+it. Only sizes are checked, not contents: hashing a multi-gigabyte archive
+on every lookup would cost more than copying it, and the entries are only
+written through put, so a size mismatch is what a crash or a truncated copy
+leaves behind. The modification time of meta.json is the last access, and
+once the cache grows beyond max_bytes the least recently used entries are
+evicted, with the entries of the EVICT_LAST stages (the integration, which
+takes hours to redo) kept until nothing else is left.
+
+Files are copied in and out rather than hard linked, because the run
+folders are rewritten in place (np.lib.format.open_memmap truncates an
+existing phase_space.npy) and a link would corrupt the cached copy.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+
+CACHE_VERSION = 1               # Bump when a stage changes what it writes
+META_FILE = "meta.json"
+DEFAULT_MAX_BYTES = 50 * 2**30
+EVICT_LAST = ('simulate',)      # Stages evicted only after every other entry
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Cannot hash {type(value).__name__} parameters")
+
+
+def digest(stage, params=None, inputs=()):
+    """
+    The key of a product: a SHA-256 of the stage, its parameters and the
+    keys of its upstream products.
+    """
+    payload = json.dumps({'version': CACHE_VERSION, 'stage': stage, 'params': params or {},
+                          'inputs': list(inputs)},
+                         sort_keys=True, default=_jsonable)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ProductCache:
+    """
+    Cache of product folders under root, kept below max_bytes.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        for name in ("objects", "tmp", "trash"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    key = staticmethod(digest)
+
+    def path(self, key):
+        return os.path.join(self.root, "objects", key[:2], key)
+
+    def _meta(self, key):
+        try:
+            with open(os.path.join(self.path(key), META_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _valid(self, key, meta):
+        """
+        True when every file of the entry is there with the size in meta.
+        Contents are not hashed.
+        """
+        entry = self.path(key)
+        for name, size in meta['files'].items():
+            try:
+                if os.path.getsize(os.path.join(entry, name)) != size:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get(self, key):
+        """
+        Folder of the entry with key, or None. Stale entries are invalidated
+        and a hit counts as an access for the LRU order.
+        """
+        if not os.path.isdir(self.path(key)):
+            return None
+        meta = self._meta(key)
+        if meta is None or not self._valid(key, meta):
+            self.invalidate(key)
+            return None
+        os.utime(os.path.join(self.path(key), META_FILE))
+        return self.path(key)
+
+    def metadata(self, key):
+        """
+        meta.json of an entry: stage, params, inputs, files and creation time.
+        """
+        return self._meta(key)
+
+    @contextmanager
+    def put(self, key, stage, params=None, inputs=()):
+        """
+        Yields an empty folder to write the product into. When the block
+        finishes without an error the folder becomes the entry with key;
+        otherwise it is thrown away.
+        """
+        tmp = os.path.join(self.root, "tmp", uuid.uuid4().hex)
+        os.makedirs(tmp)
+        try:
+            yield tmp
+            self._commit(tmp, key, stage, params, inputs)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _commit(self, tmp, key, stage, params, inputs):
+        files = {}
+        for folder, _, names in os.walk(tmp):
+            for name in names:
+                full = os.path.join(folder, name)
+                files[os.path.relpath(full, tmp)] = os.path.getsize(full)
+        meta = {'key': key, 'stage': stage, 'params': params or {}, 'inputs': list(inputs),
+                'files': files, 'created': time.time()}
+        with open(os.path.join(tmp, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2, default=_jsonable)
+
+        entry = self.path(key)
+        if os.path.isdir(entry):
+            # Replaces a stale entry; a valid one written meanwhile wins
+            if self.get(key) is not None:
+                return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            if self.get(key) is None:
+                raise
+            return
+        self.evict(keep=(key,))
+
+    def add(self, key, stage, paths, params=None, inputs=()):
+        """
+        Copies existing files into a new entry with key. paths is a list of
+        files or a {name in the entry: file} dict.
+
+        Returns the entry folder.
+        """
+        if not isinstance(paths, dict):
+            paths = {os.path.basename(path): path for path in paths}
+        with self.put(key, stage, params, inputs) as tmp:
+            for name, path in paths.items():
+                os.makedirs(os.path.dirname(os.path.join(tmp, name)), exist_ok=True)
+                shutil.copyfile(path, os.path.join(tmp, name))
+        return self.path(key)
+
+    def materialize(self, key, dest_dir, names=None):
+        """
+        Copies the files of an entry (or only names) into dest_dir.
+
+        Returns the list of paths written.
+        """
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(f"No cache entry {key}")
+        files = self._meta(key)['files']
+        written = []
+        for name in (names or files):
+            dest = os.path.join(dest_dir, name)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if os.path.exists(dest):
+                os.remove(dest)         # Never write through a file another run has open
+            shutil.copyfile(os.path.join(entry, name), dest)
+            written.append(dest)
+        return written
+
+    def invalidate(self, key):
+        """
+        Removes an entry. It leaves objects/ in one rename, so readers see
+        either the whole entry or none of it.
+        """
+        entry = self.path(key)
+        trash = os.path.join(self.root, "trash", f"{key}-{uuid.uuid4().hex}")
+        try:
+            os.rename(entry, trash)
+        except OSError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def entries(self):
+        """
+        Every entry as a dict with key, stage, size in bytes and last access
+        time, oldest access first.
+        """
+        out = []
+        objects = os.path.join(self.root, "objects")
+        for prefix in os.listdir(objects):
+            for key in os.listdir(os.path.join(objects, prefix)):
+                meta = self._meta(key)
+                if meta is None:
+                    continue
+                try:
+                    accessed = os.path.getmtime(os.path.join(self.path(key), META_FILE))
+                except OSError:
+                    continue
+                out.append({'key': key, 'stage': meta['stage'],
+                            'size': sum(meta['files'].values()), 'accessed': accessed})
+        return sorted(out, key=lambda entry: entry['accessed'])
+
+    def size(self):
+        return sum(entry['size'] for entry in self.entries())
+
+    def evict(self, max_bytes=None, keep=()):
+        """
+        Removes least recently used entries, except those in keep, until the
+        cache holds at most max_bytes (default self.max_bytes). Entries of
+        the EVICT_LAST stages go only once every other entry is gone.
+
+        Returns the keys evicted.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        # Stable sort, so each group stays in LRU order
+        entries = sorted(self.entries(), key=lambda entry: entry['stage'] in EVICT_LAST)
+        total = sum(entry['size'] for entry in entries)
+        evicted = []
+        for entry in entries:
+            if total <= max_bytes:
+                break
+            if entry['key'] in keep:
+                continue
+            self.invalidate(entry['key'])
+            total -= entry['size']
+            evicted.append(entry['key'])
+        return evicted
+
+    def clear(self):
+        for entry in self.entries():
+            self.invalidate(entry['key'])
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line entry point, python -m agnbeans.
+
+    python -m agnbeans run OUT_DIR [--set BHM=5e7 N_testparticle=2000] [--cache DIR]
+    python -m agnbeans simulate OUT_DIR [--shards 4] [--resume]
+    python -m agnbeans extract OUT_DIR
+    python -m agnbeans spectra OUT_DIR [--lines Hbeta MgII] [--set numbin=400]
+    python -m agnbeans observers OUT_DIR [--directions 500]
+    python -m agnbeans config [--set ...]
+
+The run parameters come from --config, else from OUT_DIR/config.json,
+which simulate and run write, else the RunConfig defaults, with --set
+NAME=VALUE applied on top (values are read as JSON, anything else is a
+string). Each command only imports the modules its stage needs, so a
+simulate worker never loads scipy, astropy, pandas or matplotlib.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+
+CONFIG_FILE = "config.json"
+
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return {'None': None, 'True': True, 'False': False}.get(text, text)
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs or []:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--set expects NAME=VALUE, got {pair!r}")
+        overrides[name] = parse_value(value)
+    return overrides
+
+
+def load_config(args):
+    """
+    RunConfig of a command from --config, OUT_DIR/config.json or the
+    defaults, with the --set overrides.
+    """
+    from agnbeans.config import RunConfig
+
+    overrides = parse_overrides(args.set)
+    path = args.config
+    if path is None and getattr(args, 'out_dir', None):
+        candidate = os.path.join(args.out_dir, CONFIG_FILE)
+        path = candidate if os.path.exists(candidate) else None
+    if path is None:
+        return RunConfig.from_dict(overrides)
+    return RunConfig.from_file(path, **overrides)
+
+
+def save_config(cfg, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    cfg.save(os.path.join(out_dir, CONFIG_FILE))
+
+
+# =============================================================================
+# COMMANDS
+# =============================================================================
+
+def cmd_config(args):
+    print(json.dumps(load_config(args).to_dict(), indent=1))
+
+
+def cmd_simulate(args):
+    from agnbeans import pipeline
+
+    cfg = load_config(args)
+    save_config(cfg, args.out_dir)
+    path = pipeline.simulate(cfg, args.out_dir, checkpoint_every=args.checkpoint_every,
+                             resume=args.resume, shards=args.shards)
+    print(f"Archive written to {path}")
+
+
+def cmd_extract(args):
+    from agnbeans import pipeline
+
+    store = pipeline.extract(load_config(args), args.out_dir)
+    print(f"Stored {len(store.steps)} timesteps")
+
+
+def cmd_spectra(args):
+    from agnbeans import pipeline
+
+    written = pipeline.spectra(load_config(args), args.out_dir, lines=args.lines)
+    print(f"Wrote {len(written)} spectra")
+
+
+def cmd_observers(args):
+    from agnbeans import pipeline
+
+    path = pipeline.observer_spectra(load_config(args), args.out_dir,
+                                     n_directions=args.directions)
+    print(f"Observer grid spectra written to {path}")
+
+
+def cmd_run(args):
+    from agnbeans import pipeline
+
+    cfg = load_config(args)
+    save_config(cfg, args.out_dir)
+    if args.cache:
+        from agnbeans.cache import ProductCache
+        cache = ProductCache(args.cache, max_bytes=args.cache_size)
+        pipeline.run_cached(cfg, args.out_dir, cache, lines=args.lines, shards=args.shards)
+    else:
+        pipeline.simulate(cfg, args.out_dir, checkpoint_every=args.checkpoint_every,
+                          resume=args.resume, shards=args.shards)
+        pipeline.extract(cfg, args.out_dir)
+        pipeline.spectra(cfg, args.out_dir, lines=args.lines)
+    if args.observers:
+        pipeline.observer_spectra(cfg, args.out_dir, n_directions=args.observers)
+    print(f"Run written to {args.out_dir}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m agnbeans",
+                                     description="AGN-BEANS simulation and line profile stages")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(name, func, help, out_dir=True):
+        sub = commands.add_parser(name, help=help)
+        if out_dir:
+            sub.add_argument("out_dir", help="run folder (RawData, TimestepData, ...)")
+        sub.add_argument("--config", help="JSON file of RunConfig parameters")
+        sub.add_argument("--set", nargs="+", metavar="NAME=VALUE",
+                         help="override RunConfig parameters")
+        sub.set_defaults(func=func)
+        return sub
+
+    def integration_options(sub):
+        sub.add_argument("--shards", type=int, default=None,
+                         help="split the cloud over this many processes")
+        sub.add_argument("--resume", action="store_true", help="continue from the checkpoint")
+        sub.add_argument("--checkpoint-every", type=int, default=100,
+                         help="frames between checkpoints")
+
+    command("config", cmd_config, "print the resolved parameters as JSON", out_dir=False)
+    integration_options(command("simulate", cmd_simulate, "integrate and write RawData/archive.bin"))
+    command("extract", cmd_extract, "extract the archive into the cube and timestep store")
+    sub = command("spectra", cmd_spectra, "compute luminosities and line profiles")
+    sub.add_argument("--lines", nargs="+", help="extra emission lines, e.g. Hbeta MgII CIV")
+    sub = command("observers", cmd_observers, "profiles for an equal-area grid of directions")
+    sub.add_argument("--directions", type=int, default=500, help="number of directions")
+
+    sub = command("run", cmd_run, "simulate, extract and spectra in one go")
+    integration_options(sub)
+    sub.add_argument("--lines", nargs="+", help="extra emission lines, e.g. Hbeta MgII CIV")
+    sub.add_argument("--cache", help="product cache folder, reuses unchanged stages")
+    sub.add_argument("--cache-size", type=float, default=50 * 2**30,
+                     help="bytes kept in the cache")
+    sub.add_argument("--observers", type=int, default=0,
+                     help="also compute profiles for this many directions")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    start = time.perf_counter()
+    try:
+        args.func(args)
+    except (ValueError, KeyError, FileNotFoundError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    print(f"Done in {time.perf_counter() - start:.1f} s")
+    return 0
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cloud photoionization and luminosity kernel.
+
+Takes phase-space arrays (one snapshot of shape (N+1, 6) or many of shape
+(S, N+1, 6), row 0 the central mass) and returns the cloud distance, radius,
+density, ionization parameter, Stromgren depth and luminosity of every test
+particle with the same formulas the COMBINED PLOT stage used per particle.
+"""
+
+import numpy as np
+
+
+G_ESCAPE = 6.67259e-8           # G used for the Keplerian escape test, cm^3 g^-1 s^-2
+
+
+def cloud_radius_scale(N_testparticle, p, Y, Rd, Cf, alpha):
+    """
+    Returns (ncd, Rcld): the cloud number density normalisation and the
+    cloud radius at the outer radius Rd.
+    """
+    ncd = (N_testparticle * (p + 1)) / (4 * np.pi * (Rd**3) * (1 - (Y**-(p + 1))))
+    Rcld = ((Cf * ((alpha + 1) / (np.pi * ncd * Rd)) *
+             (1 / (1 - Y**(-(alpha + 1)))))) ** 0.5
+    return ncd, Rcld
+
+
+def cloud_properties(coords, Rd, Rcld, s, n0, Q, c, alphaB, alphaeff, h, nu,
+                     BHMg=None, vkick=None):
+    """
+    Evaluates every cloud of one or many snapshots in one pass.
+
+    Returns a dict of arrays of shape (..., N): dist, Rcl, nr, Urt, ds and
+    Lvals. When BHMg and vkick are given it also holds escape_fraction, the
+    percentage of clouds whose Keplerian velocity is below the kick velocity,
+    with one value per snapshot.
+    """
+    coords = np.asarray(coords)
+    rel = coords[..., 1:, :3] - coords[..., :1, :3]
+    dist = np.sqrt(np.sum(rel**2, axis=-1))
+
+    Rcl = Rcld * (dist / Rd) ** (-s / 3)
+    nr = n0 * (dist / Rd) ** s
+
+    # Ionization Parameter
+    Urt = Q / (4 * np.pi * dist**2 * c * nr)
+
+    # Individual Cloud Luminosity, radiation bounded if the Stromgren depth
+    # is smaller than the cloud, matter bounded otherwise
+    ds = (c * Urt) / (alphaB * nr)
+    Lvals = np.where(ds < Rcl,
+                     (nr**2) * alphaeff * h * nu * np.pi * (Rcl**2) * ds,
+                     (nr**2) * alphaeff * h * nu * np.pi * (Rcl**3))
+
+    props = {'dist': dist, 'Rcl': Rcl, 'nr': nr, 'Urt': Urt, 'ds': ds, 'Lvals': Lvals}
+
+    if BHMg is not None and vkick is not None:
+        props['escape_fraction'] = escape_fraction(dist, BHMg, vkick)
+
+    return props
+
+
+def escape_fraction(dist, BHMg, vkick):
+    """
+    Percentage of clouds at distances dist (..., N) from the central mass
+    whose Keplerian velocity is below the kick velocity.
+    """
+    Vkep = np.sqrt((G_ESCAPE * BHMg) / dist)
+    return np.mean(Vkep < vkick, axis=-1) * 100
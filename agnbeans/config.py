@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run parameters for AGN-BEANS.
+
+RunConfig holds the same user parameters as the top of AGN-BEANS-Full, and
+its properties give the calculated parameters (BHMg, Rd, Q, ...) with the
+same formulas. Code units are cgs.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field, fields
+
+import numpy as np
+
+
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+
+c = 2.998e10                    # cm/s
+alphaeff = 1.1e-13              # Effective recombination coefficient for Halpha cm^3*s^-1
+alphaB = 2.6e-13                # Recombination coefficient for hydrogen cm^3*s^-1
+h = 6.62607015e-27
+nu = c / (656e-7)
+
+INTEGRATORS = ('ias15', 'whfast', 'fixed')
+
+
+@dataclass
+class RunConfig:
+    BHM: float = 5e8                # Black hole mass in solar masses
+    KVZ: float = 2121.5e5           # Kick velocity cm / s
+    KVX: float = 2121.5e5
+    KVY: float = 0
+    RS: int = 42                    # Seed for the initial conditions
+    N_testparticle: int = 10000     # Number of test particles
+    Nimg: int = 1501                # Number of frames
+    timesteps: list = field(default_factory=lambda: [0, 5, 10, 15, 20, 30, 40, 50, 75, 100,
+                                                     150, 200, 500, 1000, 1500])
+    ObsInc: list = field(default_factory=lambda: [0, 57])
+    numbin: int = 40                # Velocity bins of the line profiles
+    deposition: str = 'ngp'         # 'ngp' bins whole clouds, 'cic' splits them between bins
+    cloud_width: float = 0.0        # Thermal or turbulent velocity width of every cloud cm/s
+
+    integrator: str = 'ias15'       # 'ias15', 'whfast' (BH centred) or 'fixed' (IAS15 with a fixed step)
+    epsilon: float = 1e-9           # IAS15 accuracy parameter
+    min_dt: float = 10000           # Smallest IAS15 step in seconds
+    dt: float = None                # Step in seconds for 'whfast' and 'fixed'
+    output_times: list = None       # Physical time of every frame in seconds, replaces Nimg
+
+    Y: float = 20                   # Size scaled to BLR
+    Tsub: float = 1500              # Dust sublimation temperature
+    Eratio: float = 0.1             # Eddington ratio
+    sigma: float = 1                # Angular width
+    p: float = 0                    # Cloud distribution power law 0 for uniform distribution
+    radial: str = 'grid'            # 'grid' places the clouds at quantiles of the power law, 'random' draws them
+    s: float = 0                    # Gas density distribution 0 - constant density -2 - 1/r^2 dropoff
+    n0: float = 10**9
+
+    def __post_init__(self):
+        if self.alpha == -1:
+            raise ValueError("Value for alpha cannot be equal to -1. Check parameters")
+        if self.radial not in ('grid', 'random'):
+            raise ValueError(f"Unknown radial mode {self.radial!r}, use 'grid' or 'random'")
+        if self.deposition not in ('ngp', 'cic'):
+            raise ValueError(f"Unknown deposition {self.deposition!r}, use 'ngp' or 'cic'")
+        if self.integrator not in INTEGRATORS:
+            raise ValueError(f"Unknown integrator {self.integrator!r}, use one of {INTEGRATORS}")
+        if self.integrator != 'ias15' and not self.dt:
+            raise ValueError(f"The {self.integrator} integrator needs a step dt")
+        if self.output_times is not None:
+            self.output_times = [float(t) for t in self.output_times]
+            if np.any(np.diff(self.output_times) <= 0):
+                raise ValueError("output_times must be increasing")
+
+    @classmethod
+    def from_kick(cls, kick, angle, **kwargs):
+        """
+        Builds a config from a kick speed in cm/s and an angle in degrees
+        from the z axis, split between KVZ and KVX.
+        """
+        theta = np.deg2rad(angle)
+        return cls(KVZ=kick * np.cos(theta), KVX=kick * np.sin(theta), KVY=0, **kwargs)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, params):
+        """
+        Builds a config from a dict of fields, rejecting unknown names.
+        """
+        known = {f.name for f in fields(cls)}
+        unknown = sorted(set(params) - known)
+        if unknown:
+            raise ValueError(f"Unknown RunConfig parameters {unknown}")
+        return cls(**params)
+
+    @classmethod
+    def from_file(cls, path, **overrides):
+        """
+        Reads a config written by save, with overrides applied on top.
+        """
+        with open(path) as f:
+            params = json.load(f)
+        params.update(overrides)
+        return cls.from_dict(params)
+
+    def save(self, path):
+        """
+        Writes the fields as JSON.
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @property
+    def n_frames(self):
+        """
+        Frames in the run: one per output time, or Nimg IAS15 steps.
+        """
+        return self.Nimg if self.output_times is None else len(self.output_times)
+
+    @property
+    def save_steps(self):
+        """
+        Frames written to the archive. Every output time is saved.
+        """
+        return range(self.n_frames) if self.output_times is not None else self.timesteps
+
+    # Calculated parameters ---------------------------------------------------
+
+    @property
+    def BHMg(self):
+        return self.BHM * 1.989e+33               # Solar mass to g
+
+    @property
+    def SwR(self):
+        return (2 * self.BHMg * (6.67e-8)) / (c**2)   # Schwarzschild Radius (cm)
+
+    @property
+    def LEdd(self):
+        return 1.26e38 * (self.BHMg / 1.989e33)
+
+    @property
+    def LAGN(self):
+        return self.Eratio * self.LEdd            # Bolometric luminosity erg s**-1
+
+    @property
+    def Rd(self):
+        return (0.4 * (((self.LAGN / (10**45))**0.5) * ((1500 / self.Tsub)**2.6))) * 3.086e+18
+
+    @property
+    def Q(self):
+        qagnratio = 2.6e55 / 10e45                # Base ratio of ionizing photon luminosity to AGN luminosity
+        return qagnratio * self.LAGN              # Ionizing photon luminosity photons/s
+
+    @property
+    def alpha(self):
+        return (self.p - 2) - 2 * (self.s / 3)
+
+    @property
+    def incval(self):
+        return np.pi / 6                          # Disk inclination
+
+    @property
+    def Cf(self):
+        return 0.3 / np.sin(self.incval)          # Covering fraction for flared disk
+
+    @property
+    def vkick(self):
+        return np.sqrt(self.KVZ**2 + self.KVY**2 + self.KVX**2)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spectral emulator over the simulated parameter grid.
+
+Trained on the spectra of a finished sweep, it returns an interpolated line
+profile for any (BHM, kick speed, kick angle, inclination, time) inside the
+grid without running REBOUND. Each profile is split into its total
+luminosity and its shape (unit-area flux density on a common velocity
+grid); log10 of the luminosity and the shape are interpolated with a radial
+basis function over parameters scaled to [0, 1] (BHM in log10), and the
+shape is clipped at 0 and renormalised.
+
+The error estimate comes from leaving one grid cell (all timesteps and
+inclinations of one run) out at a time, refitting, and comparing the
+prediction with the held-out spectra. predict() reports the leave-one-out
+error of the grid cell nearest the query.
+"""
+
+import json
+import os
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+
+from agnbeans.extraction import TIMES_FILE
+from agnbeans.moments import load_library
+
+
+def load_training_set(sweep_dir):
+    """
+    Loads a sweep library and the physical time of every spectrum from the
+    save_times.npy of its run.
+
+    Returns (keys, times, velocity, flux).
+    """
+    keys, velocity, flux = load_library(sweep_dir)
+    save_times = {}
+    times = np.empty(len(keys))
+    for m, key in enumerate(keys):
+        if key['name'] not in save_times:
+            path = os.path.join(sweep_dir, key['name'], "RawData", TIMES_FILE)
+            save_times[key['name']] = np.load(path)
+        times[m] = save_times[key['name']][key['timestep']]
+    return keys, times, velocity, flux
+
+
+class SpectralEmulator:
+    """
+    RBF emulator of line profiles. Build it with from_library, query it with
+    predict.
+    """
+
+    def __init__(self, X, cells, grid, log_lum, shapes, kernel='thin_plate_spline',
+                 smoothing=0.0, loo_error=None):
+        self.X = np.asarray(X, dtype=float)            # (M, 5) raw parameters
+        self.cells = list(cells)                       # Grid cell name of each row
+        self.grid = np.asarray(grid, dtype=float)
+        self.log_lum = np.asarray(log_lum, dtype=float)
+        self.shapes = np.asarray(shapes, dtype=float)
+        self.kernel = kernel
+        self.smoothing = smoothing
+
+        U = self._transform(self.X)
+        self.lo = U.min(axis=0)
+        span = U.max(axis=0) - self.lo
+        self.span = np.where(span > 0, span, 1.0)
+        self.active = span > 0          # Parameters held fixed in the grid are left out
+
+        self._fit()
+        self.loo_error = loo_error if loo_error is not None else self.leave_one_out()
+
+    @classmethod
+    def from_library(cls, keys, times, velocity, flux, n_grid=128, **kwargs):
+        """
+        Builds the emulator from load_training_set output.
+        """
+        vmax = np.abs(velocity).max()
+        grid = np.linspace(-vmax, vmax, n_grid)
+        dv = grid[1] - grid[0]
+
+        total = flux.sum(axis=1)
+        shapes = np.empty((len(flux), n_grid))
+        for m in range(len(flux)):
+            shapes[m] = np.interp(grid, velocity[m], flux[m], left=0.0, right=0.0)
+        area = shapes.sum(axis=1, keepdims=True) * dv
+        area[area <= 0] = 1
+        shapes /= area
+
+        X = np.array([[k['BHM'], k['kick'], k['angle'], k['inclination'], t]
+                      for k, t in zip(keys, times)])
+        log_lum = np.log10(np.maximum(total, 1e-300))
+        return cls(X, [k['name'] for k in keys], grid, log_lum, shapes, **kwargs)
+
+    @staticmethod
+    def _transform(X):
+        U = np.array(X, dtype=float, copy=True)
+        U[:, 0] = np.log10(U[:, 0])
+        return U
+
+    def _scale(self, X):
+        return (self._transform(X) - self.lo) / self.span
+
+    def _fit(self, rows=None):
+        """
+        Fits the interpolator on the rows selected by a boolean mask, or on
+        every row (kept as self.rbf) if rows is None.
+        """
+        keep = np.ones(len(self.X), dtype=bool) if rows is None else rows
+        U = self._scale(self.X[keep])[:, self.active]
+        targets = np.column_stack([self.log_lum[keep], self.shapes[keep]])
+        rbf = RBFInterpolator(U, targets, kernel=self.kernel, smoothing=self.smoothing)
+        if rows is None:
+            self.rbf = rbf
+        return rbf
+
+    def _evaluate(self, rbf, U):
+        out = rbf(U[:, self.active])
+        dv = self.grid[1] - self.grid[0]
+        shapes = np.clip(out[:, 1:], 0, None)
+        area = shapes.sum(axis=1, keepdims=True) * dv
+        area[area <= 0] = 1
+        # Luminosity per grid bin
+        return shapes / area * dv * 10**out[:, :1]
+
+    def leave_one_out(self):
+        """
+        Refits without each grid cell in turn and returns {cell: relative
+        RMS error} of the held-out profiles.
+        """
+        cells = np.array(self.cells)
+        dv = self.grid[1] - self.grid[0]
+        errors = {}
+        for cell in sorted(set(self.cells)):
+            held = cells == cell
+            if held.all():
+                errors[cell] = np.nan
+                continue
+            rbf = self._fit(~held)
+            pred = self._evaluate(rbf, self._scale(self.X[held]))
+            true = self.shapes[held] * dv * 10**self.log_lum[held][:, None]
+            rms = np.sqrt(np.mean((pred - true)**2, axis=1))
+            scale = np.sqrt(np.mean(true**2, axis=1))
+            errors[cell] = float(np.mean(rms / np.where(scale > 0, scale, 1)))
+        return errors
+
+    def predict(self, BHM, kick, angle, inclination, time):
+        """
+        Emulated profiles for one or many parameter sets (scalars or equal
+        length arrays). Raises ValueError outside the training grid.
+
+        Returns (velocity grid, (Q, G) luminosity per bin, (Q,) error
+        estimates).
+        """
+        X = np.column_stack(np.broadcast_arrays(*[np.atleast_1d(np.asarray(a, dtype=float))
+                                                  for a in (BHM, kick, angle, inclination, time)]))
+        U = self._scale(X)
+        outside = np.any((U < -1e-9) | (U > 1 + 1e-9), axis=1)
+        if outside.any():
+            raise ValueError(f"Parameters outside the training grid: {X[outside].tolist()}")
+
+        profiles = self._evaluate(self.rbf, U)
+
+        # Error of the nearest grid cell, ignoring time and inclination
+        train = self._scale(self.X)[:, :3]
+        nearest = np.argmin(((U[:, None, :3] - train[None])**2).sum(axis=2), axis=1)
+        error = np.array([self.loo_error.get(self.cells[n], np.nan) for n in nearest])
+
+        return self.grid, profiles, error
+
+    def save(self, path):
+        np.savez(path, X=self.X, cells=json.dumps(self.cells), grid=self.grid,
+                 log_lum=self.log_lum, shapes=self.shapes, kernel=self.kernel,
+                 smoothing=self.smoothing, loo_error=json.dumps(self.loo_error))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['X'], json.loads(str(data['cells'])), data['grid'], data['log_lum'],
+                   data['shapes'], kernel=str(data['kernel']), smoothing=float(data['smoothing']),
+                   loo_error=json.loads(str(data['loo_error'])))
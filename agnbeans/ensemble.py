@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Seed ensembles of line profiles.
+
+One random draw of inclinations, longitudes of the ascending node and true
+anomalies gives noisy profiles. An ensemble runs the same RunConfig with M
+different seeds in a process pool. Each realization bins its saved
+timesteps onto one common velocity grid, and the parent folds the
+(timestep, velocity_bin, inclination) profiles into a running mean and
+variance with Welford's update as they finish. Memory use therefore does
+not grow with M.
+
+The convergence report follows the largest relative standard error of the
+mean profile after each realization, measured per profile as the largest
+standard error divided by the peak of the mean. That error falls as
+1/sqrt(M), so it also estimates how many realizations a target error needs.
+
+With adaptive IAS15 steps, frame i of two seeds is reached at slightly
+different times. Set output_times to combine profiles at exactly the same
+physical times.
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from agnbeans.cloud import cloud_properties, cloud_radius_scale
+from agnbeans.config import RunConfig, alphaB, alphaeff, c, h, nu
+from agnbeans.extraction import extract_archive
+from agnbeans.parallel import process_pool
+from agnbeans.projection import los_velocities
+from agnbeans.simulation import run_simulation
+from agnbeans.streaming import bin_profiles, default_velocity_range, smoothing_kernel
+
+
+ENSEMBLE_FILE = "ensemble.npz"
+
+
+class RunningStats:
+    """
+    Welford's online mean and variance of equally shaped arrays.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.n == 0:
+            self.mean = np.zeros_like(x)
+            self.m2 = np.zeros_like(x)
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        """
+        Sample variance (ddof=1), NaN until there are two samples.
+        """
+        if self.n < 2:
+            return np.full_like(self.mean, np.nan)
+        return self.m2 / (self.n - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        """
+        Standard error of the mean.
+        """
+        return self.std / np.sqrt(self.n)
+
+
+def relative_error(stats):
+    """
+    Largest standard error of any mean profile divided by that profile's
+    peak, over every timestep and inclination.
+    """
+    peak = stats.mean.max(axis=1)                               # (S, K)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rel = stats.sem.max(axis=1) / peak
+    rel = rel[peak > 0]
+    return float(rel.max()) if rel.size else np.nan
+
+
+def realizations_needed(n, error, target):
+    """
+    Realizations needed to bring a relative error measured after n of them
+    down to target, assuming it falls as 1/sqrt(n).
+    """
+    if not np.isfinite(error):
+        return None
+    return int(np.ceil(n * (error / target) ** 2))
+
+
+def run_realization(params, seed, inclinations, vel_range, numbin=40, stddev=0.5,
+                    work_dir=None):
+    """
+    Runs one seed of the RunConfig given by params in a temporary folder and
+    bins every saved timestep.
+
+    Returns (save_times, (S, numbin, K) profiles).
+    """
+    cfg = RunConfig(**dict(params, RS=seed))
+    kernel = smoothing_kernel(stddev)
+    ncd, Rcld = cloud_radius_scale(cfg.N_testparticle, cfg.p, cfg.Y, cfg.Rd, cfg.Cf, cfg.alpha)
+
+    tmp_dir = tempfile.mkdtemp(dir=work_dir)
+    try:
+        archive_path = os.path.join(tmp_dir, "archive.bin")
+        run_simulation(cfg, archive_path)
+        cube, save_times = extract_archive(archive_path, tmp_dir)
+
+        profiles = np.empty((len(cube), numbin, len(inclinations)))
+        for step in range(len(cube)):
+            Lvals = cloud_properties(cube[step], cfg.Rd, Rcld, cfg.s, cfg.n0, cfg.Q, c,
+                                     alphaB, alphaeff, h, nu)['Lvals']
+            LoS = los_velocities(cube[step, 1:, 3:], inclinations)
+            profiles[step] = bin_profiles(LoS, Lvals, vel_range, numbin, kernel)
+        del cube
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return save_times, profiles
+
+
+def run_ensemble(cfg, seeds, out_dir, vel_range=None, stddev=0.5, workers=None,
+                 target=0.05, log=print):
+    """
+    Runs cfg once per seed and combines the profiles of every saved
+    timestep and inclination in cfg.ObsInc. vel_range defaults to
+    streaming.default_velocity_range, which holds every bound cloud.
+
+    Writes out_dir/ensemble.npz with the velocity grid, inclinations, mean
+    save times, the mean profiles and their std and standard error, all
+    (S, numbin, K), and the convergence history.
+
+    Returns the dict written to the file.
+    """
+    seeds = list(seeds)
+    if vel_range is None:
+        vel_range = default_velocity_range(cfg.BHMg, cfg.Rd / cfg.Y, cfg.vkick)
+    edges = np.linspace(vel_range[0], vel_range[1], cfg.numbin + 1)
+
+    profile_stats, time_stats = RunningStats(), RunningStats()
+    history = []
+    params = cfg.to_dict()
+
+    with process_pool(workers) as pool:
+        futures = [pool.submit(run_realization, params, seed, cfg.ObsInc, vel_range,
+                               cfg.numbin, stddev) for seed in seeds]
+        for future in as_completed(futures):
+            save_times, profiles = future.result()
+            profile_stats.update(profiles)
+            time_stats.update(save_times)
+            error = relative_error(profile_stats)
+            history.append((profile_stats.n, error))
+            if log:
+                log(f"{profile_stats.n} of {len(seeds)} realizations, "
+                    f"relative error {error:.3g}")
+
+    n = np.array([entry[0] for entry in history])
+    errors = np.array([entry[1] for entry in history])
+    result = {
+        'velocity': 0.5 * (edges[1:] + edges[:-1]),
+        'inclinations': np.array(cfg.ObsInc, dtype=float),
+        'times': time_stats.mean,
+        'mean': profile_stats.mean,
+        'std': profile_stats.std,
+        'sem': profile_stats.sem,
+        'seeds': np.array(seeds),
+        'n_realizations': n,
+        'relative_error': errors,
+        'target': target,
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    np.savez(os.path.join(out_dir, ENSEMBLE_FILE), **result)
+    return result
+
+
+def convergence_report(result):
+    """
+    Text summary of how the relative error fell with the number of
+    realizations and how many a target error needs.
+    """
+    n, errors, target = result['n_realizations'], result['relative_error'], float(result['target'])
+    lines = ["Realizations  Relative error"]
+    for k, error in zip(n, errors):
+        lines.append(f"{k:12d}  {error:14.4g}")
+
+    needed = realizations_needed(n[-1], errors[-1], target)
+    if needed is None:
+        lines.append("Not enough realizations to estimate the error")
+    elif needed <= n[-1]:
+        lines.append(f"Target {target:g} reached")
+    else:
+        lines.append(f"About {needed} realizations needed for a relative error of {target:g}")
+    return "\n".join(lines)
+
+
+def load_ensemble(out_dir):
+    """
+    Reads ensemble.npz back as a dict.
+    """
+    with np.load(os.path.join(out_dir, ENSEMBLE_FILE)) as data:
+        return {name: data[name] for name in data.files}
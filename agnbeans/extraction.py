@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk extraction of the rebound Simulationarchive.
+
+Every snapshot in archive.bin is read with a single serialize_particle_data
+call straight into a memory-mapped (N_snapshots, N+1, 6) float64 cube on disk,
+instead of reading x, y, z, vx, vy, vz one particle at a time. Row 0 of each
+snapshot is the central mass and the last axis is x, y, z, vx, vy, vz.
+"""
+
+import os
+
+import numpy as np
+import rebound
+
+
+CUBE_FILE = "phase_space.npy"
+TIMES_FILE = "save_times.npy"
+
+
+def extract_archive(archive_path, out_dir):
+    """
+    Reads every snapshot of the Simulationarchive at archive_path into
+    out_dir/phase_space.npy and writes the snapshot times to
+    out_dir/save_times.npy.
+
+    Returns the cube (opened read-only as a memmap) and the save times.
+    """
+    sa = rebound.Simulationarchive(archive_path)
+    N_archives = len(sa)
+    N = sa[0].N
+
+    os.makedirs(out_dir, exist_ok=True)
+    cube = np.lib.format.open_memmap(
+        os.path.join(out_dir, CUBE_FILE), mode='w+',
+        dtype=np.float64, shape=(N_archives, N, 6)
+    )
+    save_times = np.zeros(N_archives)
+
+    for i, sim in enumerate(sa):
+        if sim.N != N:
+            raise ValueError(f"Snapshot {i} has {sim.N} particles, expected {N}")
+        save_times[i] = sim.t
+        sim.serialize_particle_data(xyzvxvyvz=cube[i])
+
+    cube.flush()
+    del cube
+    np.save(os.path.join(out_dir, TIMES_FILE), save_times)
+
+    return open_cube(out_dir)
+
+
+def open_cube(out_dir, mode='r'):
+    """
+    Opens a cube written by extract_archive without reading it into memory.
+
+    Returns (cube, save_times).
+    """
+    cube = np.load(os.path.join(out_dir, CUBE_FILE), mmap_mode=mode)
+    save_times = np.load(os.path.join(out_dir, TIMES_FILE))
+    return cube, save_times
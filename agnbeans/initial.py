@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk initial conditions for the test particle cloud.
+
+Semi-major axes follow the cloud distribution power law p between Rd/Y and
+Rd: the number of clouds per unit radius goes as r^p, the distribution the
+ncd normalisation in cloud.cloud_radius_scale assumes (p = 0 is the old
+uniform np.linspace). They are placed at evenly spaced quantiles ('grid')
+or drawn at random ('random'). Inclinations, longitudes of the ascending
+node and true anomalies are drawn in one call in the same order as the
+original per-particle loop, so a seed gives the same angles as before.
+
+The elements are converted to Cartesian coordinates in NumPy, with the
+formulas of REBOUND's orbit-to-particle conversion. add_cloud then appends
+blank particles with one sim.add call and loads all of their coordinates
+with one set_serialized_particle_data call, instead of building every
+particle from keyword arguments.
+"""
+
+import numpy as np
+import rebound
+
+
+RADIAL_MODES = ('grid', 'random')
+
+
+def power_law_radii(u, r_in, r_out, p):
+    """
+    Maps quantiles u in [0, 1] to radii between r_in and r_out with
+    dN/dr proportional to r^p.
+    """
+    u = np.asarray(u, dtype=float)
+    if p == -1:
+        return r_in * (r_out / r_in) ** u
+    k = p + 1
+    return (r_in**k + u * (r_out**k - r_in**k)) ** (1 / k)
+
+
+def initial_elements(cfg):
+    """
+    Orbital elements of every test particle as (a, inc, Omega, f) arrays.
+    """
+    N = cfg.N_testparticle
+    r_in, r_out = cfg.Rd / cfg.Y, cfg.Rd
+    rng = np.random.RandomState(cfg.RS)
+
+    # Per particle: inclination, longitude of ascending node, true anomaly
+    u = rng.random_sample((N, 3))
+    inc = -cfg.incval + (cfg.incval - -cfg.incval) * u[:, 0]
+    Omega = np.pi * u[:, 1]
+    f = u[:, 2] * 2. * np.pi
+
+    if cfg.radial == 'random':
+        a = power_law_radii(rng.random_sample(N), r_in, r_out, cfg.p)
+    elif cfg.p == 0:
+        a = np.linspace(r_in, r_out, N)     # Exactly the original spacing
+    else:
+        a = power_law_radii(np.linspace(0, 1, N), r_in, r_out, cfg.p)
+
+    return a, inc, Omega, f
+
+
+def orbital_to_cartesian(mu, a, inc, Omega, f, e=0.0, omega=0.0):
+    """
+    Positions and velocities, each (N, 3), of orbits with the given
+    elements around a primary with G*M = mu at rest at the origin.
+    """
+    a, inc, Omega, f, e, omega = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (a, inc, Omega, f, e, omega)])
+
+    r = a * (1 - e**2) / (1 + e * np.cos(f))
+    v0 = np.sqrt(mu / (a * (1 - e**2)))
+
+    cO, sO = np.cos(Omega), np.sin(Omega)
+    co, so = np.cos(omega), np.sin(omega)
+    cf, sf = np.cos(f), np.sin(f)
+    ci, si = np.cos(inc), np.sin(inc)
+
+    pos = np.empty(a.shape + (3,))
+    pos[..., 0] = r * (cO * (co * cf - so * sf) - sO * (so * cf + co * sf) * ci)
+    pos[..., 1] = r * (sO * (co * cf - so * sf) + cO * (so * cf + co * sf) * ci)
+    pos[..., 2] = r * (so * cf + co * sf) * si
+
+    vel = np.empty(a.shape + (3,))
+    vel[..., 0] = v0 * ((e + cf) * (-ci * co * sO - cO * so) - sf * (co * cO - ci * so * sO))
+    vel[..., 1] = v0 * ((e + cf) * (ci * co * cO - sO * so) - sf * (co * sO + ci * so * cO))
+    vel[..., 2] = v0 * ((e + cf) * co * si - sf * si * so)
+
+    return pos, vel
+
+
+def cloud_coordinates(cfg, G, particles=slice(None)):
+    """
+    (n, 6) Cartesian coordinates of the selected test particles relative to
+    the central mass.
+    """
+    a, inc, Omega, f = [values[particles] for values in initial_elements(cfg)]
+    pos, vel = orbital_to_cartesian(G * cfg.BHMg, a, inc, Omega, f)
+    return np.hstack([pos, vel])
+
+
+def add_cloud(sim, coords):
+    """
+    Appends len(coords) massless particles to sim at the (n, 6) coordinates
+    coords, taken relative to particle 0.
+    """
+    first = sim.N
+    sim.add([rebound.Particle() for _ in range(len(coords))])
+
+    state = np.zeros((sim.N, 6))
+    sim.serialize_particle_data(xyzvxvyvz=state)
+    state[first:] = coords + state[0]
+    sim.set_serialized_particle_data(xyzvxvyvz=state)
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Analytic Kepler propagator for the massless test particle cloud.
+
+The test particles are massless, so each one only feels the central mass, and
+after the kick the central mass moves at a constant velocity. Every cloud is
+then its own two-body problem, which is solved here for all particles at once
+with a universal-variable Kepler solver instead of being integrated with IAS15.
+
+All arrays use the same (N, 6) x, y, z, vx, vy, vz layout as
+sim.serialize_particle_data(xyzvxvyvz=...), with row 0 the central mass.
+"""
+
+import numpy as np
+
+
+# =============================================================================
+# UNIVERSAL VARIABLE SOLVER
+# =============================================================================
+
+LARGE_ROOT = 30.0       # Above this sqrt(-z), cosh and sinh equal exp / 2 in double precision
+
+
+def stumpff_c(z):
+    """
+    Stumpff function C(z) for elliptic (z > 0), parabolic and hyperbolic
+    (z < 0) orbits. A series is used near z = 0 to avoid cancellation, and
+    for large -z the exponential is divided in log space, so C only becomes
+    inf once it is itself beyond the double range.
+    """
+    z = np.asarray(z, dtype=float)
+    out = np.empty_like(z)
+
+    pos = z > 1e-6
+    neg = z < -1e-6
+    mid = ~(pos | neg)
+
+    sz = np.sqrt(z[pos])
+    out[pos] = (1 - np.cos(sz)) / z[pos]
+    sz = np.sqrt(-z[neg])
+    with np.errstate(over='ignore'):
+        out[neg] = np.where(sz > LARGE_ROOT,
+                            np.exp(sz - np.log(-2 * z[neg])),
+                            (np.cosh(np.minimum(sz, LARGE_ROOT)) - 1) / (-z[neg]))
+    zm = z[mid]
+    out[mid] = 1/2 - zm/24 + zm**2/720 - zm**3/40320
+
+    return out
+
+
+def stumpff_s(z):
+    """
+    Stumpff function S(z), with the same branches as stumpff_c.
+    """
+    z = np.asarray(z, dtype=float)
+    out = np.empty_like(z)
+
+    pos = z > 1e-6
+    neg = z < -1e-6
+    mid = ~(pos | neg)
+
+    sz = np.sqrt(z[pos])
+    out[pos] = (sz - np.sin(sz)) / sz**3
+    sz = np.sqrt(-z[neg])
+    with np.errstate(over='ignore'):
+        small = np.minimum(sz, LARGE_ROOT)
+        out[neg] = np.where(sz > LARGE_ROOT,
+                            np.exp(sz - np.log(2 * sz**3)),
+                            (np.sinh(small) - small) / small**3)
+    zm = z[mid]
+    out[mid] = 1/6 - zm/120 + zm**2/5040 - zm**3/362880
+
+    return out
+
+
+def _universal_kepler(chi, r0n, sigma0, alpha, beta, sqmu_dt):
+    """
+    Universal Kepler equation F(chi) = sqrt(mu) dt, its derivative r(chi)
+    and second derivative. F increases monotonically with chi, so where it
+    overflows it is -inf or +inf with the sign of chi.
+    """
+    z = alpha * chi**2
+    C = stumpff_c(z)
+    S = stumpff_s(z)
+    with np.errstate(over='ignore', invalid='ignore'):
+        F = sigma0 * chi**2 * C + beta * chi**3 * S + r0n * chi - sqmu_dt
+        r = sigma0 * chi * (1 - z * S) + beta * chi**2 * C + r0n
+        dr = sigma0 * (1 - z * C) + beta * chi * (1 - z * S)
+    F = np.where(np.isnan(F) | np.isinf(F), np.copysign(np.inf, chi), F)
+    return F, r, dr
+
+
+def _initial_guess(r0n, sigma0, alpha, beta, sqmu, dt):
+    """
+    Starting chi from the mean anomaly: Danby's guess E = M + 0.85 e for
+    elliptic orbits, H = log(2 N / e + 1.8) for hyperbolic ones, and
+    sqrt(mu) dt / r0 for parabolic ones. Elliptic dt is within half a
+    period.
+    """
+    chi = sqmu * dt / r0n
+
+    ell = alpha > 0
+    sa = np.sqrt(alpha[ell])
+    ecosE, esinE = beta[ell], sigma0[ell] * sa
+    E0 = np.arctan2(esinE, ecosE)
+    M = E0 - esinE + sqmu * sa**3 * dt[ell]
+    E = M + 0.85 * np.hypot(ecosE, esinE) * np.sign(np.sin(M))
+    turns = np.mod(E - E0, 2 * np.pi)
+    chi[ell] = np.where(dt[ell] < 0, turns - 2 * np.pi, turns) / sa
+
+    hyp = alpha < 0
+    sa = np.sqrt(-alpha[hyp])
+    ecoshH, esinhH = beta[hyp], sigma0[hyp] * sa
+    e = np.sqrt(np.maximum(ecoshH**2 - esinhH**2, 1.0))
+    H0 = np.arcsinh(esinhH / e)
+    N = esinhH - H0 + sqmu * sa**3 * dt[hyp]
+    H = np.sign(N) * np.log(2 * np.abs(N) / e + 1.8)
+    chi[hyp] = (H - H0) / sa
+
+    return chi
+
+
+def kepler_step(r0, v0, mu, dt, tol=1e-12, max_iter=100, precision=1e-6):
+    """
+    Moves relative positions r0 and velocities v0 (both (N, 3)) forward by dt
+    around a point mass with gravitational parameter mu = G*M.
+
+    dt can be a scalar or an array of shape (T,). For an array the result has
+    shape (T, N, 3), so many output times are solved in one call.
+
+    Bound orbits are first moved on by whole periods, so at most half a
+    period is solved for. Each universal anomaly chi is then found with
+    Laguerre-Conway iterations kept inside a bracket of the root, bisecting
+    whenever a step leaves it, which converges for any eccentricity and for
+    hyperbolic orbits. Raises RuntimeError for particles that have not
+    converged after max_iter iterations, or whose rounding error is
+    estimated above precision as a fraction of r.
+
+    Returns (r, v).
+    """
+    r0 = np.asarray(r0, dtype=float)
+    v0 = np.asarray(v0, dtype=float)
+    dt = np.asarray(dt, dtype=float)
+    scalar = dt.ndim == 0
+    dt = np.atleast_1d(dt)[:, None]                      # (T, 1)
+    sqmu = np.sqrt(mu)
+
+    r0n = np.linalg.norm(r0, axis=1)                     # (N,)
+    sigma0 = np.einsum('ij,ij->i', r0, v0) / sqmu        # r0 . v0 / sqrt(mu)
+    alpha = 2 / r0n - np.einsum('ij,ij->i', v0, v0) / mu # 1 / semi major axis
+    beta = 1 - alpha * r0n
+
+    shape = np.broadcast_shapes(dt.shape, r0n.shape)     # (T, N)
+    r0n_, sigma0_, alpha_, beta_ = (np.broadcast_to(a, shape).ravel()
+                                    for a in (r0n, sigma0, alpha, beta))
+    tof = np.broadcast_to(dt, shape).astype(float).ravel()
+
+    # Bound orbits repeat every period: solve for dt less than half a period
+    # from the epoch, with chi within one turn of the eccentric anomaly
+    ell = alpha_ > 0
+    turn = 2 * np.pi / np.sqrt(alpha_[ell])
+    period = turn / (sqmu * alpha_[ell])
+    tof[ell] -= np.round(tof[ell] / period) * period
+    lo = np.where(tof < 0, -np.inf, 0.0)
+    hi = np.where(tof > 0, np.inf, 0.0)
+    lo[ell] = np.where(tof[ell] < 0, -turn, 0.0)
+    hi[ell] = np.where(tof[ell] > 0, turn, 0.0)
+
+    chi = _initial_guess(r0n_, sigma0_, alpha_, beta_, sqmu, tof)
+
+    # Unbound orbits: double a bound on chi until it is past the root
+    open_ = np.flatnonzero(np.isinf(lo) | np.isinf(hi))
+    bound = np.maximum(np.abs(chi[open_]), sqmu * np.abs(tof[open_]) / r0n_[open_])
+    while open_.size:
+        trial = np.copysign(bound, tof[open_])
+        F, _, _ = _universal_kepler(trial, r0n_[open_], sigma0_[open_], alpha_[open_],
+                                    beta_[open_], sqmu * tof[open_])
+        past = np.sign(F) == np.sign(tof[open_])
+        lo[open_[past & (tof[open_] < 0)]] = trial[past & (tof[open_] < 0)]
+        hi[open_[past & (tof[open_] > 0)]] = trial[past & (tof[open_] > 0)]
+        open_, bound = open_[~past], 2 * bound[~past]
+
+    inside = (chi > lo) & (chi < hi)
+    chi = np.where(inside, chi, 0.5 * (lo + hi))
+
+    n = 5   # Laguerre-Conway order
+    active = np.flatnonzero(lo < hi)
+    for _ in range(max_iter):
+        if not active.size:
+            break
+        x = chi[active]
+        F, r, dr = _universal_kepler(x, r0n_[active], sigma0_[active], alpha_[active],
+                                     beta_[active], sqmu * tof[active])
+        a_lo = np.where(F < 0, x, lo[active])
+        a_hi = np.where(F < 0, hi[active], x)
+        lo[active], hi[active] = a_lo, a_hi
+
+        with np.errstate(over='ignore', invalid='ignore'):
+            root = np.sqrt(np.abs((n - 1)**2 * r**2 - n * (n - 1) * F * dr))
+            delta = n * F / (r + root)
+        step = x - delta
+        width = a_hi - a_lo
+        done = ((np.abs(delta) <= tol * np.abs(x))
+                | (width <= tol * np.maximum(np.abs(a_lo), np.abs(a_hi))))
+        # Bisect where the step is not finite or leaves the bracket
+        bisect = (width > 0) & ~(done & np.isfinite(step)) & ~((step > a_lo) & (step < a_hi))
+        chi[active] = np.where(bisect, a_lo + 0.5 * width, step)
+        active = active[~done]
+
+    if active.size:
+        raise RuntimeError(f"Kepler solver did not converge for {active.size} particle "
+                           f"times after {max_iter} iterations")
+
+    chi = chi.reshape(shape)
+    tof = tof.reshape(shape)
+    z = alpha * chi**2
+    C = stumpff_c(z)
+    S = stumpff_s(z)
+
+    f = 1 - chi**2 / r0n * C
+    g = tof - chi**3 / sqmu * S
+    r = f[..., None] * r0 + g[..., None] * v0
+    rn = np.linalg.norm(r, axis=-1)
+    fdot = sqmu / (rn * r0n) * (alpha * chi**3 * S - chi)
+    gdot = 1 - chi**2 / rn * C
+    v = fdot[..., None] * r0 + gdot[..., None] * v0
+
+    # Rounding error relative to r, from the noise of the Kepler equation
+    # terms in chi and from f r0 + g v0. It is large only when the terms are
+    # far longer than r, e.g. going back to pericentre from far out on a
+    # hyperbola, where they cancel
+    terms = np.abs(sigma0 * chi**2 * C) + np.abs(beta * chi**3 * S) + r0n * np.abs(chi)
+    v0n = np.linalg.norm(v0, axis=1)
+    rounding = np.finfo(float).eps * (terms * np.linalg.norm(v, axis=-1) / sqmu
+                                      + chi**2 * np.abs(C) + r0n
+                                      + (np.abs(tof) + np.abs(chi**3 * S) / sqmu) * v0n) / rn
+    lost = ~(rounding <= precision)
+    if lost.any():
+        raise RuntimeError(f"Kepler solution lost precision for {lost.sum()} particle "
+                           f"times, error up to {np.nanmax(rounding):.1e} of r")
+
+    if scalar:
+        return r[0], v[0]
+    return r, v
+
+
+# =============================================================================
+# CLOUD PROPAGATOR
+# =============================================================================
+
+class KeplerCloud:
+    """
+    Massless test particle cloud around a central mass moving at constant
+    velocity. Holds the state at one epoch and solves for any later time.
+    """
+
+    def __init__(self, coords, mu, t0=0.0):
+        coords = np.asarray(coords, dtype=float)
+        self.mu = float(mu)
+        self.t0 = float(t0)
+        self.central = coords[0].copy()
+        self.r_rel = coords[1:, :3] - coords[0, :3]
+        self.v_rel = coords[1:, 3:] - coords[0, 3:]
+
+    @classmethod
+    def from_simulation(cls, sim):
+        """
+        Builds the cloud from the current state of a rebound.Simulation.
+        """
+        coords = np.zeros((sim.N, 6))
+        sim.serialize_particle_data(xyzvxvyvz=coords)
+        return cls(coords, sim.G * sim.particles[0].m, t0=sim.t)
+
+    def propagate(self, t):
+        """
+        Returns the (N+1, 6) phase space array at time t. If t is an array of
+        T times the result is (T, N+1, 6).
+        """
+        t = np.asarray(t, dtype=float)
+        r, v = kepler_step(self.r_rel, self.v_rel, self.mu, t - self.t0)
+
+        dt = np.atleast_1d(t - self.t0)[:, None]
+        central_pos = self.central[:3] + self.central[3:] * dt  # (T, 3)
+        central_vel = np.broadcast_to(self.central[3:], central_pos.shape)
+
+        if t.ndim == 0:
+            r, v = r[None], v[None]
+        coords = np.empty((len(dt), len(self.r_rel) + 1, 6))
+        coords[:, 0, :3] = central_pos
+        coords[:, 0, 3:] = central_vel
+        coords[:, 1:, :3] = r + central_pos[:, None, :]
+        coords[:, 1:, 3:] = v + central_vel[:, None, :]
+
+        if t.ndim == 0:
+            return coords[0]
+        return coords
+
+    def kick(self, velocity, t):
+        """
+        Sets the central mass velocity to velocity (vx, vy, vz) at time t.
+        The test particles keep their velocities, so their velocities
+        relative to the central mass change by the same amount.
+        """
+        coords = self.propagate(t)
+        velocity = np.asarray(velocity, dtype=float)
+
+        self.t0 = float(t)
+        self.r_rel = coords[1:, :3] - coords[0, :3]
+        self.v_rel = coords[1:, 3:] - velocity
+        self.central = coords[0].copy()
+        self.central[3:] = velocity
+
+
+# =============================================================================
+# VALIDATION
+# =============================================================================
+
+def compare_coords(coords, reference):
+    """
+    Compares two phase space arrays particle by particle. Position errors are
+    relative to each particle's distance from the central mass and velocity
+    errors to its speed relative to the central mass.
+
+    Returns (max position error, max velocity error).
+    """
+    r_ref = reference[1:, :3] - reference[0, :3]
+    v_ref = reference[1:, 3:] - reference[0, 3:]
+
+    dr = np.linalg.norm(coords[1:, :3] - reference[1:, :3], axis=1)
+    dv = np.linalg.norm(coords[1:, 3:] - reference[1:, 3:], axis=1)
+
+    pos_err = dr / np.linalg.norm(r_ref, axis=1)
+    vel_err = dv / np.linalg.norm(v_ref, axis=1)
+
+    return pos_err.max(), vel_err.max()
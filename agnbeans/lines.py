@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Emission line registry.
+
+Each EmissionLine has its own rest wavelength, effective emission
+coefficient and bounding rule, and line_luminosities evaluates every
+registered line for all clouds of one or many snapshots from the dist, nr,
+Rcl, ds and Urt arrays of cloud.cloud_properties, which are computed once
+and shared. line_spectra then bins all lines and inclinations of a snapshot
+together with synthesis.synthesize.
+
+Bounding rules:
+
+    recombination       pi Rcl^2 ds while the Stromgren depth is inside the
+                        cloud (radiation bounded), pi Rcl^3 once the whole
+                        cloud is ionized (matter bounded), as for Halpha
+    radiation_bounded   pi Rcl^2 ds, but only for radiation bounded clouds,
+                        which have the partially ionized zone behind the
+                        ionization front that low ionization lines need
+
+A line can also be limited to clouds with ionization parameter between
+U_min and U_max. Halpha and Hbeta use case B effective recombination
+coefficients. MgII and CIV are not recombination lines; their
+coefficients are scaled from Hbeta by the line ratios of the SDSS quasar
+composite (Vanden Berk et al. 2001), so they are rough estimates meant for
+line shapes, not line strengths. Register better models with
+register_line.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from agnbeans.config import c, h
+from agnbeans.synthesis import synthesize
+
+
+BOUNDING_RULES = ('recombination', 'radiation_bounded')
+
+
+@dataclass(frozen=True)
+class EmissionLine:
+    name: str
+    wavelength: float               # Rest wavelength in cm
+    coefficient: float              # Effective emission coefficient cm^3 s^-1
+    bounding: str = 'recombination'
+    U_min: float = 0.0              # Range of ionization parameters that emit the line
+    U_max: float = np.inf
+
+    def __post_init__(self):
+        if self.bounding not in BOUNDING_RULES:
+            raise ValueError(f"Unknown bounding rule {self.bounding!r}, use one of {BOUNDING_RULES}")
+
+    @property
+    def nu(self):
+        return c / self.wavelength
+
+
+LINES = {}
+
+
+def register_line(line):
+    """
+    Adds line to the registry, replacing a line of the same name.
+    """
+    LINES[line.name] = line
+    return line
+
+
+def get_lines(names=None):
+    """
+    The registered lines called names, or every registered line.
+    """
+    if names is None:
+        return list(LINES.values())
+    missing = [name for name in names if name not in LINES]
+    if missing:
+        raise KeyError(f"Unknown emission lines {missing}, registered: {list(LINES)}")
+    return [LINES[name] for name in names]
+
+
+# Composite quasar line fluxes relative to Hbeta (Vanden Berk et al. 2001)
+_HBETA_ALPHA = 3.03e-14
+_HBETA_WAVELENGTH = 4861.33e-8
+
+
+def _scaled_from_hbeta(flux_ratio, wavelength):
+    # Same energy flux ratio to Hbeta for equal emitting volumes
+    return flux_ratio * _HBETA_ALPHA * wavelength / _HBETA_WAVELENGTH
+
+
+register_line(EmissionLine('Halpha', 656e-7, 1.1e-13))
+register_line(EmissionLine('Hbeta', _HBETA_WAVELENGTH, _HBETA_ALPHA))
+register_line(EmissionLine('MgII', 2798.75e-8, _scaled_from_hbeta(14.725 / 8.649, 2798.75e-8),
+                           bounding='radiation_bounded'))
+register_line(EmissionLine('CIV', 1549.06e-8, _scaled_from_hbeta(25.291 / 8.649, 1549.06e-8),
+                           U_min=1e-2))
+
+
+def line_luminosities(props, lines=None):
+    """
+    Luminosity of every cloud in every line. props is the dict returned by
+    cloud.cloud_properties, with arrays of shape (..., N).
+
+    Returns {line name: (..., N) luminosities}.
+    """
+    lines = get_lines() if lines is None else lines
+    nr, Rcl, ds, Urt = props['nr'], props['Rcl'], props['ds'], props['Urt']
+
+    # Shared by every line
+    bounded = ds < Rcl
+    nr2 = nr**2
+    area, volume = Rcl**2, Rcl**3
+
+    out = {}
+    for line in lines:
+        # Same order of operations as cloud_properties, so Halpha matches Lvals
+        scale = nr2 * line.coefficient * h * line.nu * np.pi
+        radiation = scale * area * ds
+        if line.bounding == 'recombination':
+            L = np.where(bounded, radiation, scale * volume)
+        else:
+            L = np.where(bounded, radiation, 0.0)
+        if line.U_min > 0 or np.isfinite(line.U_max):
+            L = np.where((Urt >= line.U_min) & (Urt <= line.U_max), L, 0.0)
+        out[line.name] = L
+    return out
+
+
+def line_spectra(LoS, luminosities, vel_ranges, numbin=40, stddev=0.5, **kwargs):
+    """
+    Bins the clouds of one snapshot for every line and inclination at once.
+    LoS is (K, N), luminosities is (L, N) or a {name: (N,)} dict and
+    vel_ranges holds one (lo, hi) range per inclination. Other keywords go
+    to synthesis.synthesize.
+
+    Returns (velocity (K, numbin) bin centres, (L, K, numbin) profiles).
+    """
+    if isinstance(luminosities, dict):
+        luminosities = list(luminosities.values())
+    return synthesize(LoS, np.atleast_2d(luminosities), vel_ranges, numbin,
+                      stddev=stddev, **kwargs)
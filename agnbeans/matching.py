@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Nearest-neighbour matching of observed line profiles against the simulated
+spectral library.
+
+Every simulated spectrum becomes one vector: its flux resampled onto a
+common velocity grid and scaled to unit peak, followed by its profile
+measurements (FWHM, FWQM, centroid, asymmetry, kurtosis) standardised over
+the library. A KD-tree over these vectors answers top-k queries for whole
+batches of observed spectra, which are resampled and measured the same way.
+The index is saved to one .npz file and the tree rebuilt on loading.
+"""
+
+import glob
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from agnbeans.moments import profile_moments
+
+
+FEATURES = ['FWHM', 'FWQM', 'centroid', 'asymmetry', 'kurtosis_ip']
+
+
+def resample(velocity, flux, grid):
+    """
+    Interpolates (M, B) spectra onto grid (G,) and scales each to unit peak.
+    Flux outside a spectrum's velocity range is 0.
+    """
+    out = np.empty((len(flux), len(grid)))
+    for m in range(len(flux)):
+        out[m] = np.interp(grid, velocity[m], flux[m], left=0.0, right=0.0)
+    peak = out.max(axis=1, keepdims=True)
+    peak[peak <= 0] = 1
+    return out / peak
+
+
+class SpectralIndex:
+    """
+    KD-tree over the simulated library. keys holds one dict of run
+    parameters, timestep and inclination per spectrum.
+    """
+
+    def __init__(self, grid, vectors, keys, feature_mean, feature_std, feature_weight):
+        self.grid = grid
+        self.vectors = vectors
+        self.keys = keys
+        self.feature_mean = feature_mean
+        self.feature_std = feature_std
+        self.feature_weight = feature_weight
+        self.tree = cKDTree(vectors)
+
+    @classmethod
+    def build(cls, keys, velocity, flux, n_grid=64, feature_weight=1.0):
+        """
+        Builds the index from a library loaded with moments.load_library.
+        The grid spans the widest velocity range in the library.
+        """
+        vmax = np.abs(velocity).max()
+        grid = np.linspace(-vmax, vmax, n_grid)
+        shapes = resample(velocity, flux, grid)
+
+        feats = cls._features(grid, shapes)
+        mean = np.nanmean(feats, axis=0)
+        std = np.nanstd(feats, axis=0)
+        std[std == 0] = 1
+
+        vectors = cls._combine(shapes, feats, mean, std, feature_weight)
+        return cls(grid, vectors, list(keys), mean, std, feature_weight)
+
+    @staticmethod
+    def _features(grid, shapes):
+        G = np.broadcast_to(grid, shapes.shape)
+        moments = profile_moments(G, shapes)
+        return np.column_stack([moments[name] for name in FEATURES])
+
+    @staticmethod
+    def _combine(shapes, feats, mean, std, weight):
+        feats = np.nan_to_num((feats - mean) / std)
+        return np.hstack([shapes, weight * feats])
+
+    def vectorize(self, velocity, flux):
+        """
+        Turns (M, B) observed spectra into query vectors. Velocities are in
+        cm/s; each spectrum may have its own velocity grid.
+        """
+        shapes = resample(velocity, flux, self.grid)
+        feats = self._features(self.grid, shapes)
+        return self._combine(shapes, feats, self.feature_mean, self.feature_std,
+                             self.feature_weight)
+
+    def query(self, velocity, flux, k=5):
+        """
+        Finds the k closest simulated spectra for every observed spectrum.
+
+        Returns one list per observed spectrum of k dicts holding the key of
+        the match and its distance.
+        """
+        distances, indices = self.tree.query(self.vectorize(velocity, flux), k=k, workers=-1)
+        distances = distances.reshape(len(flux), k)
+        indices = indices.reshape(len(flux), k)
+
+        return [[dict(self.keys[i], distance=float(d)) for d, i in zip(row_d, row_i)]
+                for row_d, row_i in zip(distances, indices)]
+
+    def save(self, path):
+        np.savez(path, grid=self.grid, vectors=self.vectors,
+                 feature_mean=self.feature_mean, feature_std=self.feature_std,
+                 feature_weight=self.feature_weight, keys=json.dumps(self.keys))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['grid'], data['vectors'], json.loads(str(data['keys'])),
+                   data['feature_mean'], data['feature_std'], float(data['feature_weight']))
+
+
+def load_observed(pattern, velocity_scale=1e5):
+    """
+    Loads observed spectra from text files matching pattern. Each file has
+    a velocity column and a flux column (comma or whitespace separated, '#'
+    comments allowed). velocity_scale converts the velocities to cm/s; the
+    default assumes km/s.
+
+    Returns (names, velocity, flux) with velocity and flux padded with NaN
+    to a common length, ready for SpectralIndex.query.
+    """
+    paths = sorted(glob.glob(pattern))
+    spectra = []
+    for path in paths:
+        with open(path) as f:
+            delimiter = "," if "," in f.readline() + f.readline() else None
+        data = np.genfromtxt(path, delimiter=delimiter, comments="#",
+                             invalid_raise=False)
+        data = data[np.all(np.isfinite(data[:, :2]), axis=1)]
+        order = np.argsort(data[:, 0])
+        spectra.append((data[order, 0] * velocity_scale, data[order, 1]))
+
+    length = max((len(v) for v, f in spectra), default=0)
+    velocity = np.full((len(spectra), length), np.nan)
+    flux = np.full((len(spectra), length), np.nan)
+    for m, (v, f) in enumerate(spectra):
+        # Repeat the last point so padding does not change the interpolation
+        velocity[m, :len(v)], velocity[m, len(v):] = v, v[-1]
+        flux[m, :len(f)], flux[m, len(f):] = f, f[-1]
+
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    return names, velocity, flux
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Line profile measurements for whole spectral libraries.
+
+The spectra of every run, timestep and inclination are stacked into 2D
+(M spectra, B bins) velocity and flux arrays, and width, shift, asymmetry
+and kurtosis are measured for all M at once:
+
+    FWHM, FWQM      full width at half / quarter maximum, interpolated
+                    between bins at the outermost crossings
+    centroid        flux weighted mean velocity (the line shift)
+    pearson_skew    Pearson's second skewness 3 (mean - median) / sigma
+    asymmetry       interpercentile asymmetry (v90 + v10 - 2 v50) / (v90 - v10)
+    kurtosis        fourth standardised moment (3 for a Gaussian)
+    kurtosis_ip     interpercentile kurtosis (v75 - v25) / (v90 - v10)
+
+Velocities are in cm/s like the ProcessedSpectra files.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from agnbeans.spectra import read_spectrum
+from agnbeans.sweep import MANIFEST_FILE
+
+
+# =============================================================================
+# LIBRARY LOADING
+# =============================================================================
+
+def load_library(sweep_dir):
+    """
+    Loads every ProcessedSpectra/t{step}.csv of the finished cells of a
+    sweep. All spectra must have the same number of bins.
+
+    Returns (keys, velocity, flux): keys is a list of dicts with name, BHM,
+    kick, angle, timestep and inclination, velocity and flux are (M, B).
+    Each row of velocity is the grid its inclination was binned on.
+    """
+    with open(os.path.join(sweep_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    keys, velocity, flux = [], [], []
+    for name, record in sorted(manifest.items()):
+        if record['status'] != 'done':
+            continue
+        for path in record['spectra']:
+            step = int(os.path.basename(path)[1:-4])
+            velocities, profiles = read_spectrum(path)
+            for inc, profile in profiles.items():
+                keys.append(dict(record['params'], timestep=step, inclination=inc))
+                velocity.append(velocities[inc])
+                flux.append(profile)
+
+    return keys, np.array(velocity), np.array(flux)
+
+
+# =============================================================================
+# MEASUREMENTS
+# =============================================================================
+
+def _crossings(velocity, flux, level):
+    """
+    Velocity of the outermost left and right crossings of level (M,) by
+    each spectrum, linearly interpolated between bins.
+    """
+    M, B = flux.shape
+    rows = np.arange(M)
+    above = flux >= level[:, None]
+
+    left = np.argmax(above, axis=1)                       # First bin above
+    right = B - 1 - np.argmax(above[:, ::-1], axis=1)     # Last bin above
+
+    def interp(i_out, i_in):
+        f_out, f_in = flux[rows, i_out], flux[rows, i_in]
+        v_out, v_in = velocity[rows, i_out], velocity[rows, i_in]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(f_in != f_out, (level - f_out) / (f_in - f_out), 1.0)
+        return v_out + frac * (v_in - v_out)
+
+    v_left = interp(np.maximum(left - 1, 0), left)
+    v_right = interp(np.minimum(right + 1, B - 1), right)
+    return v_left, v_right
+
+
+def width_at(velocity, flux, fraction):
+    """
+    Full width of every spectrum at fraction of its peak.
+    """
+    level = fraction * flux.max(axis=1)
+    v_left, v_right = _crossings(velocity, flux, level)
+    return v_right - v_left
+
+
+def percentile_velocities(velocity, flux, quantiles):
+    """
+    Velocities below which each quantile of the total flux lies, as a
+    (len(quantiles), M) array. The flux of a bin is spread evenly across it,
+    so the cumulative flux is interpolated linearly between bin edges.
+    """
+    M, B = flux.shape
+    rows = np.arange(M)
+    cdf = np.zeros((M, B + 1))
+    np.cumsum(flux, axis=1, out=cdf[:, 1:])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cdf = cdf / cdf[:, -1:]
+
+    # Uniform bins: edge j sits half a bin below centre j
+    dv = velocity[:, 1] - velocity[:, 0]
+    v0 = velocity[:, 0] - dv / 2
+
+    out = np.empty((len(quantiles), M))
+    for n, q in enumerate(quantiles):
+        hi = np.clip(np.sum(cdf < q, axis=1), 1, B)
+        lo = hi - 1
+        c_lo, c_hi = cdf[rows, lo], cdf[rows, hi]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.clip(np.where(c_hi > c_lo, (q - c_lo) / (c_hi - c_lo), 0.0), 0, 1)
+        out[n] = v0 + (lo + frac) * dv
+    return out
+
+
+def profile_moments(velocity, flux):
+    """
+    Measures every spectrum of (M, B) velocity and flux arrays.
+
+    Returns a dict of (M,) arrays, see the module docstring for the names.
+    """
+    velocity = np.asarray(velocity, dtype=float)
+    flux = np.clip(np.asarray(flux, dtype=float), 0, None)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = flux.sum(axis=1)
+        weights = flux / total[:, None]
+        centroid = np.sum(weights * velocity, axis=1)
+        dv = velocity - centroid[:, None]
+        sigma = np.sqrt(np.sum(weights * dv**2, axis=1))
+        kurtosis = np.sum(weights * dv**4, axis=1) / sigma**4
+
+        v10, v25, v50, v75, v90 = percentile_velocities(velocity, flux,
+                                                        [0.1, 0.25, 0.5, 0.75, 0.9])
+        pearson_skew = 3 * (centroid - v50) / sigma
+        asymmetry = (v90 + v10 - 2 * v50) / (v90 - v10)
+        kurtosis_ip = (v75 - v25) / (v90 - v10)
+
+    return {
+        'FWHM': width_at(velocity, flux, 0.5),
+        'FWQM': width_at(velocity, flux, 0.25),
+        'centroid': centroid,
+        'sigma': sigma,
+        'v50': v50,
+        'pearson_skew': pearson_skew,
+        'asymmetry': asymmetry,
+        'kurtosis': kurtosis,
+        'kurtosis_ip': kurtosis_ip,
+        'total_flux': total,
+    }
+
+
+def feature_table(keys, velocity, flux):
+    """
+    Measures a loaded library and returns a pandas DataFrame with one row
+    per spectrum: the key columns followed by the measurements.
+    """
+    import pandas as pd
+
+    table = pd.DataFrame(keys)
+    for name, values in profile_moments(velocity, flux).items():
+        table[name] = values
+    return table
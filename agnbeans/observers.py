@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Observer grids covering the whole sky.
+
+ObsInc tilts the observer about the x axis only, so it samples one great
+circle of viewing directions; with a kick that has an x component the
+profiles also depend on the azimuth. An ObserverGrid holds any set of unit
+vectors pointing from the cloud to the observer, by default a Fibonacci
+lattice, which splits the sphere into cells of equal area, so every
+direction has the same solid angle weight.
+
+The LoS velocity of a cloud seen from direction n is n . v, so inclination
+i of ObsInc is the direction at polar angle i and azimuth 90 degrees. The
+projections of every cloud onto every direction are one matrix product per
+snapshot, and all directions are binned onto one common velocity grid with
+synthesis.synthesize, giving a (snapshot, direction, velocity bin) array
+that can be averaged over all orientations or over bands of inclination.
+"""
+
+import numpy as np
+
+from agnbeans.synthesis import synthesize
+
+
+def fibonacci_directions(n):
+    """
+    (n, 3) unit vectors of a Fibonacci lattice, each the centre of one of
+    n cells of equal area on the sphere.
+    """
+    k = np.arange(n) + 0.5
+    cos_theta = 1 - 2 * k / n
+    phi = np.pi * (1 + np.sqrt(5)) * k
+    sin_theta = np.sqrt(1 - cos_theta**2)
+    return np.column_stack([sin_theta * np.cos(phi), sin_theta * np.sin(phi), cos_theta])
+
+
+def angle_directions(inclinations, azimuths=90.0):
+    """
+    (K, 3) unit vectors at polar angles inclinations and azimuths in
+    degrees. The default azimuth gives the directions of ObsInc.
+    """
+    theta, phi = np.broadcast_arrays(np.deg2rad(np.asarray(inclinations, dtype=float)),
+                                     np.deg2rad(np.asarray(azimuths, dtype=float)))
+    return np.column_stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi),
+                            np.cos(theta)])
+
+
+class ObserverGrid:
+    """
+    Viewing directions (D, 3) with solid angle weights that sum to 1.
+    """
+
+    def __init__(self, directions, weights=None):
+        directions = np.atleast_2d(np.asarray(directions, dtype=float))
+        self.directions = directions / np.linalg.norm(directions, axis=1, keepdims=True)
+        D = len(self.directions)
+        weights = np.full(D, 1.0 / D) if weights is None else np.asarray(weights, dtype=float)
+        self.weights = weights / weights.sum()
+
+    @classmethod
+    def fibonacci(cls, n):
+        """
+        n equal-area directions over the whole sphere.
+        """
+        return cls(fibonacci_directions(n))
+
+    @classmethod
+    def from_angles(cls, inclinations, azimuths=90.0):
+        return cls(angle_directions(inclinations, azimuths))
+
+    def __len__(self):
+        return len(self.directions)
+
+    @property
+    def inclinations(self):
+        """
+        Polar angle of every direction from the z axis in degrees.
+        """
+        return np.rad2deg(np.arccos(np.clip(self.directions[:, 2], -1, 1)))
+
+    @property
+    def azimuths(self):
+        """
+        Azimuth of every direction from the x axis in degrees, 0 to 360.
+        """
+        return np.rad2deg(np.arctan2(self.directions[:, 1], self.directions[:, 0])) % 360
+
+    def project(self, velocities):
+        """
+        Projects (..., N, 3) velocities onto every direction. Returns an
+        array of shape (..., D, N).
+        """
+        return self.directions @ np.swapaxes(np.asarray(velocities), -1, -2)
+
+    def spectra(self, velocities, Lvals, vel_range=None, numbin=40, padding=0.1,
+                chunk_size=2**22, **kwargs):
+        """
+        Line profiles of every snapshot and direction on one velocity grid.
+        velocities is (S, N, 3), e.g. cube[steps, 1:, 3:], and Lvals (S, N).
+        vel_range defaults to the largest cloud speed, which bounds every
+        projection, widened by padding. Snapshots are projected chunk_size
+        LoS values at a time; other keywords go to synthesis.synthesize.
+
+        Returns (velocity (numbin,) bin centres, (S, D, numbin) profiles).
+        """
+        S, N = len(velocities), np.shape(velocities)[1]
+        if vel_range is None:
+            vmax = max(float(np.sqrt((np.asarray(velocities[s])**2).sum(axis=1)).max())
+                       for s in range(S))
+            vel_range = (-(1 + padding) * vmax, (1 + padding) * vmax)
+        ranges = np.tile(vel_range, (len(self), 1))
+
+        chunk = max(1, chunk_size // (len(self) * N))
+        profiles = np.empty((S, len(self), numbin))
+        for start in range(0, S, chunk):
+            stop = min(start + chunk, S)
+            los = self.project(np.asarray(velocities[start:stop]))
+            velocity, profiles[start:stop] = synthesize(los, np.asarray(Lvals[start:stop]),
+                                                        ranges, numbin, **kwargs)
+        return velocity[0], profiles
+
+    def average(self, profiles, mask=None):
+        """
+        Solid angle weighted mean of (..., D, numbin) profiles over every
+        direction, or over the directions selected by mask.
+        """
+        weights = self.weights if mask is None else np.where(mask, self.weights, 0.0)
+        return np.einsum('d,...db->...b', weights / weights.sum(), profiles)
+
+    def inclination_bands(self, edges):
+        """
+        Band index of every direction for inclination band edges in degrees,
+        -1 outside them.
+        """
+        band = np.searchsorted(edges, self.inclinations, side='right') - 1
+        return np.where((band >= 0) & (band < len(edges) - 1), band, -1)
+
+    def average_by_inclination(self, profiles, edges):
+        """
+        Averages (..., D, numbin) profiles over azimuth in bands of
+        inclination with the given edges in degrees.
+
+        Returns (..., len(edges) - 1, numbin), NaN for empty bands.
+        """
+        band = self.inclination_bands(edges)
+        out = []
+        for b in range(len(edges) - 1):
+            mask = band == b
+            if mask.any():
+                out.append(self.average(profiles, mask))
+            else:
+                out.append(np.full(profiles.shape[:-2] + profiles.shape[-1:], np.nan))
+        return np.stack(out, axis=-2)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process pools for the AGN-BEANS scripts.
+
+The scripts are run cell by cell and are not wrapped in
+if __name__ == '__main__', so the spawn start method (the default on macOS
+and Windows) would re-run the whole script, folder deletion included, in
+every worker. Pools made here use fork wherever the platform has it.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def default_workers():
+    """
+    Number of cores available to this process.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def process_pool(workers=None, initializer=None, initargs=()):
+    """
+    Returns a ProcessPoolExecutor with workers processes (all cores if None).
+    """
+    if workers is None:
+        workers = default_workers()
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=initializer, initargs=initargs)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The AGN-BEANS stages as functions working on one run folder laid out like
+BASE_DIR in AGN-BEANS-Full:
+
+    RawData/archive.bin, phase_space.npy, save_times.npy
+    TimestepData/index.json and the column files
+    TimestepData/ProcessedSpectra/t{step}.csv
+    TimestepData/ProcessedSpectra/{line}/t{step}.csv for extra emission lines
+    TimestepData/ProcessedSpectra/observers.npz for the full-sky grid
+
+run_cached runs the same stages through a cache.ProductCache.
+
+No plots are made here; the scripts do that.
+"""
+
+import os
+
+import numpy as np
+
+from agnbeans.cache import digest
+from agnbeans.cloud import cloud_properties, cloud_radius_scale
+from agnbeans.config import alphaB, alphaeff, c, h, nu
+from agnbeans.extraction import extract_archive, open_cube
+from agnbeans.lines import get_lines, line_luminosities
+from agnbeans.observers import ObserverGrid
+from agnbeans.projection import ProjectionCache
+from agnbeans.sharding import run_sharded
+from agnbeans.simulation import run_simulation
+from agnbeans.spectra import write_spectrum
+from agnbeans.store import TimestepStore
+from agnbeans.synthesis import synthesize
+
+
+OBSERVERS_FILE = "observers.npz"
+
+
+def run_dirs(base_dir):
+    """
+    Returns (RAW_DATA_DIR, TIMESTEP_DIR, SPECTRA_DIR) for a run folder,
+    creating them if needed.
+    """
+    raw = os.path.join(base_dir, "RawData")
+    timestep = os.path.join(base_dir, "TimestepData")
+    spectra = os.path.join(timestep, "ProcessedSpectra")
+    for path in (raw, timestep, spectra):
+        os.makedirs(path, exist_ok=True)
+    return raw, timestep, spectra
+
+
+def checkpoint_dir(base_dir):
+    return os.path.join(base_dir, "RawData", "Checkpoint")
+
+
+def simulate(cfg, base_dir, checkpoint_every=100, resume=False, shards=None):
+    """
+    Integrates the run and writes RawData/archive.bin, checkpointing to
+    RawData/Checkpoint. With resume=True a checkpointed run is continued.
+    With shards set the cloud is split over that many processes instead,
+    without checkpoints (see sharding.py).
+    """
+    raw, _, _ = run_dirs(base_dir)
+    archive_path = os.path.join(raw, "archive.bin")
+    if shards:
+        run_sharded(cfg, raw, shards=shards)
+        return archive_path
+    run_simulation(cfg, archive_path, checkpoint_dir=checkpoint_dir(base_dir),
+                   checkpoint_every=checkpoint_every, resume=resume)
+    return archive_path
+
+
+def extract(cfg, base_dir):
+    """
+    Extracts the archive into the phase-space cube and the timestep store.
+    """
+    raw, timestep, _ = run_dirs(base_dir)
+    cube, save_times = extract_archive(os.path.join(raw, "archive.bin"), raw)
+    return TimestepStore.create(timestep, cube, save_times)
+
+
+def luminosities(cfg, cube, steps):
+    """
+    cloud.cloud_properties of the saved timesteps steps of the cube.
+    """
+    ncd, Rcld = cloud_radius_scale(cfg.N_testparticle, cfg.p, cfg.Y, cfg.Rd, cfg.Cf, cfg.alpha)
+    return cloud_properties(cube[steps], cfg.Rd, Rcld, cfg.s, cfg.n0, cfg.Q, c,
+                            alphaB, alphaeff, h, nu)
+
+
+def write_luminosity(store, steps, Lvals):
+    """
+    Stores the (S, N) cloud luminosities as the Luminosity column.
+    """
+    store.add_column('Luminosity')
+    for step_index, step in enumerate(steps):
+        store.write('Luminosity', step, Lvals[step_index])
+
+
+def spectra(cfg, base_dir, lines=None, clouds=None, out_dir=None):
+    """
+    Computes cloud luminosities and the line profile of every timestep and
+    inclination, and writes ProcessedSpectra/t{step}.csv. lines names
+    emission lines of the lines.py registry whose profiles are also written
+    to ProcessedSpectra/{line}/t{step}.csv. Profiles use cfg.numbin bins,
+    cfg.deposition and the cloud velocity width cfg.cloud_width. clouds
+    reuses luminosities already computed, and out_dir replaces
+    ProcessedSpectra.
+
+    Returns the list of spectrum files written.
+    """
+    raw, timestep, spectra_dir = run_dirs(base_dir)
+    spectra_dir = out_dir or spectra_dir
+    cube, save_times = open_cube(raw)
+    store = TimestepStore(timestep)
+    steps = [int(step) for step in store.steps]
+
+    projections = ProjectionCache(cube[:, 1:, 3:], cfg.ObsInc)
+    vel_ranges = projections.global_ranges(steps)
+
+    if clouds is None:
+        clouds = luminosities(cfg, cube, steps)
+    write_luminosity(store, steps, clouds['Lvals'])
+
+    # Lvals and every extra line, binned over all timesteps and inclinations at once
+    line_names = [line.name for line in get_lines(lines)] if lines else []
+    line_Lvals = line_luminosities(clouds, get_lines(lines)) if lines else {}
+    weights = np.stack([clouds['Lvals']] + [line_Lvals[name] for name in line_names], axis=1)
+    LoS = np.stack([projections.project(step) for step in steps])          # (S, K, N)
+    velocity, profiles = synthesize(LoS, weights, [vel_ranges[inc] for inc in cfg.ObsInc],
+                                    cfg.numbin, deposition=cfg.deposition, sigma=cfg.cloud_width)
+
+    written = []
+    for step_index, step in enumerate(steps):
+        for l, name in enumerate([None] + line_names):
+            folder = spectra_dir if name is None else os.path.join(spectra_dir, name)
+            path = os.path.join(folder, f"t{step}.csv")
+            write_spectrum(path, dict(zip(cfg.ObsInc, velocity)),
+                           dict(zip(cfg.ObsInc, profiles[step_index, l])))
+            written.append(path)
+
+    return written
+
+
+def observer_spectra(cfg, base_dir, n_directions=500, numbin=None):
+    """
+    Line profiles of every timestep seen from n_directions equal-area
+    directions over the whole sky, on one velocity grid. Writes
+    ProcessedSpectra/observers.npz with the directions, their inclinations
+    and azimuths, the velocity grid, the (S, D, numbin) profiles and their
+    orientation average.
+
+    Returns the path written.
+    """
+    raw, timestep, spectra_dir = run_dirs(base_dir)
+    cube, save_times = open_cube(raw)
+    steps = [int(step) for step in TimestepStore(timestep).steps]
+
+    Lvals = luminosities(cfg, cube, steps)['Lvals']
+
+    grid = ObserverGrid.fibonacci(n_directions)
+    velocity, profiles = grid.spectra(cube[steps, 1:, 3:], Lvals, numbin=numbin or cfg.numbin,
+                                      deposition=cfg.deposition, sigma=cfg.cloud_width)
+
+    path = os.path.join(spectra_dir, OBSERVERS_FILE)
+    np.savez(path, steps=steps, times=save_times[steps], directions=grid.directions,
+             inclinations=grid.inclinations, azimuths=grid.azimuths, velocity=velocity,
+             profiles=profiles, average=grid.average(profiles))
+    return path
+
+
+# =============================================================================
+# CACHED RUNS
+# =============================================================================
+
+# RunConfig fields only used after the integration
+POSTPROCESS_FIELDS = ('ObsInc', 'numbin', 'deposition', 'cloud_width', 's', 'n0')
+
+
+def stage_keys(cfg, lines=None):
+    """
+    Cache keys of the simulate, extract, luminosity and spectra products of
+    cfg, each chained to the key of the product it is computed from.
+    """
+    params = cfg.to_dict()
+    keys = {}
+    keys['simulate'] = digest('simulate', {name: value for name, value in params.items()
+                                           if name not in POSTPROCESS_FIELDS})
+    keys['extract'] = digest('extract', None, [keys['simulate']])
+    keys['luminosity'] = digest('luminosity', {
+        'N_testparticle': cfg.N_testparticle, 'p': cfg.p, 'Y': cfg.Y, 's': cfg.s, 'n0': cfg.n0,
+        'Rd': cfg.Rd, 'Q': cfg.Q, 'Cf': cfg.Cf, 'alpha': cfg.alpha,
+        'constants': [c, alphaB, alphaeff, h, nu]}, [keys['extract']])
+    keys['spectra'] = digest('spectra', {
+        'ObsInc': cfg.ObsInc, 'numbin': cfg.numbin, 'deposition': cfg.deposition,
+        'cloud_width': cfg.cloud_width, 'lines': [line.name for line in get_lines(lines)]
+        if lines else []}, [keys['luminosity']])
+    return keys
+
+
+def run_cached(cfg, base_dir, cache, lines=None, shards=None, log=print):
+    """
+    Runs every stage into base_dir like simulate, extract and spectra, but
+    takes each product from the ProductCache cache when its key is there
+    and adds the products it computes. Changing only post-processing
+    parameters reuses the integration. When the archive has been evicted
+    but the cube extracted from it is still cached, the integration is
+    skipped and RawData gets no archive.bin.
+
+    Returns {stage: 'cached', 'computed' or 'skipped'}.
+    """
+    raw, timestep, spectra_dir = run_dirs(base_dir)
+    keys = stage_keys(cfg, lines)
+    status = {}
+
+    upstream = {'extract': 'simulate', 'luminosity': 'extract', 'spectra': 'luminosity'}
+
+    def stage(name, compute, dest, names=None):
+        if cache.get(keys[name]) is None:
+            inputs = [keys[upstream[name]]] if name in upstream else []
+            with cache.put(keys[name], name, inputs=inputs) as tmp:
+                compute(tmp)
+            status[name] = 'computed'
+        else:
+            status[name] = 'cached'
+        if log:
+            log(f"{name}: {status[name]} ({keys[name][:12]})")
+        cache.materialize(keys[name], dest, names)
+
+    def integrate(tmp):
+        if shards:
+            run_sharded(cfg, tmp, shards=shards)
+        else:
+            run_simulation(cfg, os.path.join(tmp, "archive.bin"))
+
+    def extract_cube(tmp):
+        cube, save_times = extract_archive(os.path.join(raw, "archive.bin"), tmp)
+        del cube
+
+    # The archive is only needed to extract the cube, so look the cube up first
+    if cache.get(keys['simulate']) is not None or cache.get(keys['extract']) is None:
+        stage('simulate', integrate, raw, ["archive.bin"])
+    else:
+        status['simulate'] = 'skipped'
+        archive_path = os.path.join(raw, "archive.bin")
+        if os.path.exists(archive_path):
+            os.remove(archive_path)     # Left by an earlier run of another config
+        if log:
+            log(f"simulate: skipped, the extracted cube is cached ({keys['simulate'][:12]})")
+    stage('extract', extract_cube, raw)
+    cube, save_times = open_cube(raw)
+    store = TimestepStore.create(timestep, cube, save_times)
+    steps = [int(step) for step in store.steps]
+
+    stage('luminosity', lambda tmp: np.savez(os.path.join(tmp, "clouds.npz"),
+                                             **luminosities(cfg, cube, steps)), raw)
+    with np.load(os.path.join(raw, "clouds.npz")) as data:
+        clouds = {name: data[name] for name in data.files}
+
+    stage('spectra', lambda tmp: spectra(cfg, base_dir, lines, clouds=clouds, out_dir=tmp),
+          spectra_dir)
+    if status['spectra'] == 'cached':
+        write_luminosity(store, steps, clouds['Lvals'])
+    return status
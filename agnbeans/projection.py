@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Line-of-sight projection of the cloud velocities.
+
+The observer is inclined by ObsInc degrees about the x axis, so the LoS
+velocity is the z component of rotation_matrix @ vel. Here that product is
+done for every particle and every inclination of a snapshot in one batched
+matrix product, and the results are cached per (timestep, inclination) so
+the velocity range pass and the spectrum binning pass share them.
+"""
+
+import numpy as np
+
+
+def rotation_matrices(inclinations):
+    """
+    Returns the (K, 3, 3) rotations about the x axis for K inclinations in
+    degrees, the same rotation_matrix the spectrum code used per particle.
+    """
+    theta = np.deg2rad(np.asarray(inclinations, dtype=float))
+    R = np.zeros((len(theta), 3, 3))
+    R[:, 0, 0] = 1
+    R[:, 1, 1] = np.cos(theta)
+    R[:, 1, 2] = -np.sin(theta)
+    R[:, 2, 1] = np.sin(theta)
+    R[:, 2, 2] = np.cos(theta)
+    return R
+
+
+def los_velocities(velocities, inclinations):
+    """
+    Projects (..., N, 3) velocities onto the line of sight of every
+    inclination. Returns an array of shape (..., K, N).
+    """
+    los_rows = rotation_matrices(inclinations)[:, 2, :]         # (K, 3)
+    return np.einsum('kj,...nj->...kn', los_rows, np.asarray(velocities))
+
+
+class ProjectionCache:
+    """
+    LoS velocities of the test particles, computed once per snapshot for all
+    inclinations. velocities is indexed by timestep and gives the (N, 3)
+    test particle velocities, e.g. cube[:, 1:, 3:] of the phase-space cube.
+    """
+
+    def __init__(self, velocities, inclinations):
+        self.velocities = velocities
+        self.inclinations = list(inclinations)
+        self._column = {inc: k for k, inc in enumerate(self.inclinations)}
+        self._cache = {}
+
+    def project(self, step):
+        """
+        Returns the (K, N) LoS velocities of one timestep.
+        """
+        if step not in self._cache:
+            self._cache[step] = los_velocities(self.velocities[step], self.inclinations)
+        return self._cache[step]
+
+    def get(self, step, inc):
+        """
+        Returns the LoS velocities of one timestep for one inclination.
+        """
+        return self.project(step)[self._column[inc]]
+
+    def global_ranges(self, steps, padding=0.1):
+        """
+        Min/max LoS velocity for each inclination across all steps, widened
+        to include 0 and then expanded by padding of the range.
+
+        Returns {inclination: (vmin, vmax)}.
+        """
+        los = np.stack([self.project(step) for step in steps])    # (S, K, N)
+        vmin = np.minimum(los.min(axis=(0, 2)), 0)
+        vmax = np.maximum(los.max(axis=(0, 2)), 0)
+        pad = padding * (vmax - vmin)
+
+        return {inc: (vmin[k] - pad[k], vmax[k] + pad[k])
+                for k, inc in enumerate(self.inclinations)}
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frame rendering for the INTEGRATION stage.
+
+The integration loop only captures the phase-space array of the frames that
+are saved and hands it to a RenderPool. Each worker process keeps one
+FrameRenderer whose figure, scatters and colorbars are built once and then
+updated in place, so no figure is built for frames that are never saved.
+"""
+
+import os
+
+import numpy as np
+
+from agnbeans.parallel import process_pool
+
+
+class FrameRenderer:
+    """
+    One persistent 2x2 figure with the XZ, XY and YZ projections and a text
+    panel. draw() moves the points, recolours them and saves the frame.
+    """
+
+    def __init__(self, KVX, KVY, KVZ, dpi=200):
+        # A bare Figure needs no pyplot backend and is never shown
+        from matplotlib.figure import Figure
+
+        self.header = ("SMBH Recoil\nInitial Z velocity (cm/s): " + str(KVZ)
+                       + "\nInitial X velocity (cm/s): " + str(KVX)
+                       + "\nInitial Y velocity (cm/s): " + str(KVY))
+
+        self.fig = Figure(figsize=(12, 10), dpi=dpi)
+        (ax3, ax4), (ax1, ax2) = self.fig.subplots(2, 2)
+        empty = np.zeros((0, 2))
+
+        # XY graph
+        self.scatterxy = ax1.scatter(empty[:, 0], empty[:, 1], c=[], cmap='coolwarm_r', s=2.5)
+        self.fig.colorbar(self.scatterxy, ax=ax1, label='Z-Velocity')
+        self.bhxy = ax1.scatter([0], [0], marker='x', c='black', s=50)
+        ax1.set_title("XY")
+        ax1.set_xlabel('Distance in cm')
+
+        # YZ graph
+        self.scatteryz = ax2.scatter(empty[:, 0], empty[:, 1], c=[], cmap='coolwarm', s=2.5)
+        self.fig.colorbar(self.scatteryz, ax=ax2, label='X-Velocity')
+        ax2.scatter(0, 0, marker='+', color='k', s=75)
+        self.bhyz = ax2.scatter([0], [0], marker='*', c='m', s=75)
+        ax2.tick_params(axis='y', labelcolor='w')
+        ax2.set_title("YZ")
+        ax2.set_xlabel('Distance in cm')
+
+        # XZ graph
+        self.scatterxz = ax3.scatter(empty[:, 0], empty[:, 1], c=[], cmap='coolwarm', s=2.5)
+        self.fig.colorbar(self.scatterxz, ax=ax3, label='Y-Velocity')
+        ax3.scatter(0, 0, marker='+', color='k', s=75)
+        self.bhxz = ax3.scatter([0], [0], marker='*', c='m', s=75)
+        ax3.tick_params(axis='x', labelcolor='w')
+        ax3.set_title("XZ")
+        ax3.set_ylabel('Distance in cm')
+
+        # Empty space
+        ax4.axis('off')
+        self.title = ax4.set_title(self.header, fontsize=13)
+
+        self.axes = (ax1, ax2, ax3)
+
+    @staticmethod
+    def _update(ax, scatter, px, py, colour):
+        """
+        Moves one scatter to (px, py), recolours it and rescales the axes the
+        way plt.scatter autoscaling would.
+        """
+        scatter.set_offsets(np.column_stack([px, py]))
+        scatter.set_array(colour)
+        scatter.set_clim(colour.min(), colour.max())
+
+        for lo, hi, setter in ((px.min(), px.max(), ax.set_xlim),
+                               (py.min(), py.max(), ax.set_ylim)):
+            pad = 0.05 * (hi - lo) if hi > lo else 1.0
+            setter(lo - pad, hi + pad)
+
+    def draw(self, coords, t, path):
+        """
+        Renders the (N+1, 6) phase space array at simulation time t to path.
+        """
+        ax1, ax2, ax3 = self.axes
+        x, y, z = coords[:, 0], coords[:, 1], coords[:, 2]
+
+        self._update(ax1, self.scatterxy, x, y, coords[:, 5])
+        self._update(ax2, self.scatteryz, z, y, coords[:, 3])
+        self._update(ax3, self.scatterxz, x, z, coords[:, 4])
+        self.bhxy.set_offsets([[x[0], y[0]]])
+        self.bhyz.set_offsets([[z[0], y[0]]])
+        self.bhxz.set_offsets([[x[0], z[0]]])
+
+        self.title.set_text(self.header + '\nTimestep: ' + f"{t:.3e}" + ' seconds')
+        self.fig.savefig(path)
+
+
+# =============================================================================
+# RENDER POOL
+# =============================================================================
+
+_renderer = None
+
+
+def _init_worker(KVX, KVY, KVZ, dpi):
+    global _renderer
+    _renderer = FrameRenderer(KVX, KVY, KVZ, dpi=dpi)
+
+
+def _draw_frame(coords, t, path):
+    _renderer.draw(coords, t, path)
+    return path
+
+
+class RenderPool:
+    """
+    Renders frames in background processes while the integration continues.
+    With workers=0 frames are drawn in the calling process instead.
+
+    submit() blocks once more than max_pending frames are waiting, so a slow
+    renderer cannot pile up snapshots in memory.
+    """
+
+    def __init__(self, KVX, KVY, KVZ, workers=2, dpi=200, max_pending=None):
+        self.workers = workers
+        self.pending = []
+        self.max_pending = max_pending or 2 * max(workers, 1)
+
+        if workers > 0:
+            self.executor = process_pool(workers, initializer=_init_worker,
+                                         initargs=(KVX, KVY, KVZ, dpi))
+        else:
+            self.executor = None
+            self.renderer = FrameRenderer(KVX, KVY, KVZ, dpi=dpi)
+
+    def submit(self, coords, t, path):
+        """
+        Queues one frame. coords is copied, so the caller can reuse its array.
+        """
+        if self.executor is None:
+            self.renderer.draw(coords, t, path)
+            return
+
+        while len(self.pending) >= self.max_pending:
+            self.pending.pop(0).result()
+        self.pending.append(self.executor.submit(_draw_frame, np.array(coords), t, path))
+
+    def close(self):
+        """
+        Waits for every queued frame and shuts the workers down.
+        """
+        if self.executor is None:
+            return
+        for future in self.pending:
+            future.result()
+        self.pending = []
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def frame_path(directory, i):
+    """
+    Path of frame i, matching the image_{i}.jpg names used before.
+    """
+    return os.path.join(directory, f"image_{i}.jpg")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The SIMULATION and INTEGRATION stages of AGN-BEANS-Full as functions, so a
+run can be started from a worker process without the plotting code.
+
+By default every frame is one IAS15 sim.step(), so frame times are whatever
+IAS15 picks. With output_times set, frame i is instead reached with
+sim.integrate(output_times[i], exact_finish_time=1), so snapshots fall on
+exactly the requested physical times whichever integrator is used:
+
+    ias15   adaptive IAS15 with accuracy epsilon and smallest step min_dt
+    whfast  WHFast with step dt in democratic heliocentric coordinates,
+            centred on the black hole; much faster, with energy errors set
+            by dt instead of a tolerance
+    fixed   IAS15 with epsilon = 0, which takes fixed steps of dt
+
+run_kepler solves the orbits analytically instead (kepler.py). Its frames
+fall on the same times as an integrated run, which it can only know with
+output_times or a fixed-step integrator.
+"""
+
+import os
+import time
+
+import numpy as np
+import rebound
+
+from agnbeans.checkpoint import (clear_checkpoints, has_checkpoint,
+                                 load_checkpoint, save_checkpoint)
+from agnbeans.initial import add_cloud, cloud_coordinates
+from agnbeans.kepler import KeplerCloud
+
+
+def build_simulation(cfg, particles=slice(None)):
+    """
+    Sets up the central mass and the test particle cloud of a RunConfig,
+    loading the whole cloud at once (see initial.py). particles selects a
+    part of the cloud (a slice or index array); the selected particles get
+    the same orbits as in the full cloud.
+    """
+    sim = rebound.Simulation()    # Initialize the simulation
+    sim.units = ('s', 'cm', 'g')  # Set simulation units
+    sim.add(m=cfg.BHMg)           # Add the central particle
+    add_cloud(sim, cloud_coordinates(cfg, sim.G, particles))
+    sim.N_active = 1              # Only the central particle exerts gravity
+
+    configure_integrator(sim, cfg.integrator, cfg.epsilon, cfg.min_dt, cfg.dt)
+    return sim
+
+
+def configure_integrator(sim, integrator='ias15', epsilon=1e-9, min_dt=10000, dt=None):
+    """
+    Selects and sets up the integrator of sim, see the module docstring.
+    """
+    if integrator == 'ias15':
+        sim.integrator = 'ias15'
+        sim.ri_ias15.epsilon = epsilon
+        sim.ri_ias15.min_dt = min_dt    # Set minimum timestep length in seconds
+    elif integrator == 'fixed':
+        sim.integrator = 'ias15'
+        sim.ri_ias15.epsilon = 0        # Turns off the adaptive step
+        sim.dt = dt
+    elif integrator == 'whfast':
+        sim.integrator = 'whfast'
+        sim.ri_whfast.coordinates = 'democraticheliocentric'
+        sim.dt = dt
+    else:
+        raise ValueError(f"Unknown integrator {integrator!r}")
+
+
+def advance(sim, cfg, i):
+    """
+    Runs frame i: one sim.step(), or an exact integration to
+    cfg.output_times[i].
+    """
+    if cfg.output_times is None:
+        sim.step()
+    else:
+        sim.integrate(cfg.output_times[i], exact_finish_time=1)
+
+
+def frame_times(cfg):
+    """
+    Physical time at the end of every frame when it can be known before the
+    run: the output times, or one step of dt per frame for the fixed-step
+    integrators. Adaptive IAS15 picks its frame times as it goes, so they
+    cannot be reproduced without running it and this raises ValueError.
+    """
+    if cfg.output_times is not None:
+        return np.asarray(cfg.output_times, dtype=float)
+    if cfg.integrator in ('fixed', 'whfast'):
+        return cfg.dt * np.arange(1, cfg.n_frames + 1)
+    raise ValueError("The kepler propagator needs output_times or a fixed-step integrator "
+                     "('fixed' or 'whfast' with dt) to know the frame times")
+
+
+def apply_kick(sim, cfg):
+    """
+    Sets the velocity of the central particle to the kick velocity.
+    """
+    sim.particles[0].vz = -cfg.KVZ
+    sim.particles[0].vx = cfg.KVX
+    sim.particles[0].vy = cfg.KVY
+
+
+def run_simulation(cfg, archive_path, sim=None, checkpoint_dir=None,
+                   checkpoint_every=100, resume=False, stream=None, telemetry=None):
+    """
+    Integrates cfg.n_frames frames and appends the state after every frame
+    in cfg.save_steps to the Simulationarchive at archive_path. An existing
+    archive at that path is replaced.
+
+    With checkpoint_dir set, a checkpoint is written every checkpoint_every
+    frames. With resume=True the run continues from the last checkpoint in
+    checkpoint_dir instead of starting again, keeping the archive written
+    so far.
+
+    stream, a streaming.SpectrumStream, gets the state after every frame.
+    telemetry, a telemetry.Telemetry, records every step.
+
+    Returns the simulation at the end of the run.
+    """
+    start = 0
+    if resume and checkpoint_dir and has_checkpoint(checkpoint_dir):
+        sim, start = load_checkpoint(checkpoint_dir, archive_path)
+    else:
+        if sim is None:
+            sim = build_simulation(cfg)
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+        if checkpoint_dir:
+            clear_checkpoints(checkpoint_dir)
+
+    save_steps = set(cfg.save_steps)
+    coords = np.zeros((sim.N, 6))
+    for i in range(start, cfg.n_frames):
+        if i > 0:
+            apply_kick(sim, cfg)
+        start_step = time.perf_counter()
+        advance(sim, cfg, i)
+        if telemetry is not None:
+            telemetry.step(i, sim, time.perf_counter() - start_step)
+        if stream is not None:
+            sim.serialize_particle_data(xyzvxvyvz=coords)
+            stream.add(i, sim.t, coords)
+        if i in save_steps:
+            sim.save_to_file(archive_path)
+        if checkpoint_dir and (i + 1) % checkpoint_every == 0:
+            save_checkpoint(sim, i + 1, checkpoint_dir, archive_path)
+
+    return sim
+
+
+def run_kepler(cfg, archive_path, sim=None, stream=None):
+    """
+    The same run as run_simulation with the analytic Kepler propagator:
+    frame 0 is integrated, then the cloud is kicked and every later frame
+    is solved directly at its time in frame_times(cfg), so the archive
+    holds the snapshots run_simulation would save at the same times.
+
+    Returns the simulation at the last frame.
+    """
+    times = frame_times(cfg)
+    if sim is None:
+        sim = build_simulation(cfg)
+    if os.path.exists(archive_path):
+        os.remove(archive_path)
+
+    advance(sim, cfg, 0)
+    # Massless clouds around a coasting BH are independent two-body problems
+    cloud = KeplerCloud.from_simulation(sim)
+    cloud.kick((cfg.KVX, cfg.KVY, -cfg.KVZ), sim.t)
+
+    save_steps = set(cfg.save_steps)
+    coords = np.zeros((sim.N, 6))
+    sim.serialize_particle_data(xyzvxvyvz=coords)
+    for i in range(cfg.n_frames):
+        if i > 0 and (i in save_steps or stream is not None):
+            coords = cloud.propagate(times[i])
+            sim.set_serialized_particle_data(xyzvxvyvz=coords)
+        if i > 0:
+            sim.t = times[i]
+        if stream is not None:
+            stream.add(i, sim.t, coords)
+        if i in save_steps:
+            sim.save_to_file(archive_path)
+
+    return sim
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Binned, smoothed line profiles and the ProcessedSpectra/t{step}.csv files.
+
+astropy and scipy are imported on the first line_profile call, so workers
+that only read or write spectra do not pay for them.
+"""
+
+import os
+
+import numpy as np
+
+
+def line_profile(LoS, Lvals, vel_range, numbin=40, stddev=0.5):
+    """
+    Sums the cloud luminosities into numbin LoS velocity bins over vel_range
+    and smooths the result with a Gaussian kernel of stddev bins.
+
+    Returns (bin centres, smoothed luminosity per bin).
+    """
+    from astropy.convolution import Gaussian1DKernel, convolve
+    from scipy import stats
+
+    Lsum, edges, binnumber = stats.binned_statistic(
+        LoS, Lvals, statistic="sum", bins=numbin, range=vel_range
+    )
+    sortedV = 0.5 * (edges[1:] + edges[:-1])
+    Lsum = convolve(Lsum, Gaussian1DKernel(stddev=stddev))
+    return sortedV, Lsum
+
+
+def write_spectrum(path, velocities, profiles):
+    """
+    Writes one timestep as a CSV with a Velocity-{inc} column of bin
+    centres followed by an obsInc-{inc} column for every inclination, as
+    each inclination is binned over its own velocity range. profiles is
+    {inc: luminosity} and velocities {inc: bin centres}.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    header, columns = [], []
+    for inc, profile in profiles.items():
+        header += [f"Velocity-{inc}", f"obsInc-{inc}"]
+        columns += [velocities[inc], profile]
+    np.savetxt(path, np.column_stack(columns), delimiter=",", header=",".join(header),
+               comments="", fmt="%.18g")
+
+
+def read_spectrum(path):
+    """
+    Reads a ProcessedSpectra CSV back as ({inc: bin centres},
+    {inc: luminosity}). Files with a single Velocity column, written before
+    every inclination had its own, give that column for every inclination.
+    """
+    with open(path) as f:
+        header = f.readline().strip().split(",")
+    data = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    columns = {}
+    for k, name in enumerate(header):
+        kind, _, inc = name.partition("-")
+        columns[kind, float(inc) if inc else None] = data[:, k]
+    profiles = {inc: column for (kind, inc), column in columns.items() if kind == "obsInc"}
+    velocities = {inc: columns.get(("Velocity", inc), columns.get(("Velocity", None)))
+                  for inc in profiles}
+    return velocities, profiles
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Binary columnar store for per-timestep particle data.
+
+Replaces the simXdata.csv -> t{i}.csv round trip. Each column (X, Y, Z, Vx,
+Vy, Vz and derived columns such as Luminosity) is one float64 .npy file of
+shape (N_snapshots, N_testparticle) that is opened as a memmap, so any single
+timestep can be read without parsing the others. index.json holds the
+snapshot times and the list of columns.
+
+Only the test particles are stored; the central mass is row 0 of the
+phase-space cube and is dropped here, as the COMBINED PLOT stage always did.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+INDEX_FILE = "index.json"
+PHASE_COLUMNS = ['X', 'Y', 'Z', 'Vx', 'Vy', 'Vz']     # Same titles as the t{i}.csv files
+
+
+class TimestepStore:
+    """
+    Columnar timestep data kept in one folder. Steps are snapshot indices in
+    the Simulationarchive, the same numbers the t{i}.csv files used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.times = np.array(index['times'])
+        self.n_particles = index['n_particles']
+        self.columns = list(index['columns'])
+        self._open = {}
+
+    @classmethod
+    def create(cls, path, cube, save_times):
+        """
+        Writes a new store at path from an (N_snapshots, N+1, 6) phase-space
+        cube and its snapshot times. Columns from a previous store in the
+        same folder are removed.
+        """
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                for name in json.load(f)['columns']:
+                    old = os.path.join(path, f"{name}.npy")
+                    if os.path.exists(old):
+                        os.remove(old)
+
+        for k, name in enumerate(PHASE_COLUMNS):
+            np.save(os.path.join(path, f"{name}.npy"),
+                    np.ascontiguousarray(cube[:, 1:, k]))
+
+        index = {
+            'times': [float(t) for t in save_times],
+            'n_particles': int(cube.shape[1] - 1),
+            'columns': PHASE_COLUMNS,
+        }
+        with open(index_path, 'w') as f:
+            json.dump(index, f, indent=1)
+
+        return cls(path)
+
+    @property
+    def steps(self):
+        return np.arange(len(self.times))
+
+    def _save_index(self):
+        index = {
+            'times': [float(t) for t in self.times],
+            'n_particles': self.n_particles,
+            'columns': self.columns,
+        }
+        tmp_path = os.path.join(self.path, INDEX_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE))
+
+    def column(self, name, mode='r'):
+        """
+        Returns the whole (N_snapshots, N_testparticle) column as a memmap.
+        """
+        if name not in self.columns:
+            raise KeyError(f"No column named {name} in {self.path}")
+        key = (name, mode)
+        if key not in self._open:
+            self._open[key] = np.load(os.path.join(self.path, f"{name}.npy"),
+                                      mmap_mode=mode)
+        return self._open[key]
+
+    def read(self, step, columns=None):
+        """
+        Returns {column name: array of length N_testparticle} for one step.
+        """
+        if columns is None:
+            columns = self.columns
+        return {name: np.array(self.column(name)[step]) for name in columns}
+
+    def add_column(self, name, fill=np.nan):
+        """
+        Adds a derived column filled with fill, to be written step by step
+        with write(). An existing column of the same name is kept.
+        """
+        if name in self.columns:
+            return
+        col = np.lib.format.open_memmap(
+            os.path.join(self.path, f"{name}.npy"), mode='w+',
+            dtype=np.float64, shape=(len(self.times), self.n_particles)
+        )
+        col[:] = fill
+        col.flush()
+        del col
+        self.columns.append(name)
+        self._save_index()
+
+    def write(self, name, step, values):
+        """
+        Stores values for one step of a derived column.
+        """
+        col = self.column(name, mode='r+')
+        col[step] = values
+        col.flush()
+
+    def to_dataframe(self, step):
+        """
+        Returns one step as a pandas DataFrame with the t{i}.csv layout.
+        """
+        import pandas as pd
+        return pd.DataFrame(self.read(step))
+
+    def export_csv(self, out_dir):
+        """
+        Writes every step to out_dir/t{step}.csv. This is a side output for
+        inspecting the data; the pipeline itself reads the binary columns.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        for step in self.steps:
+            self.to_dataframe(step).to_csv(os.path.join(out_dir, f"t{step}.csv"))
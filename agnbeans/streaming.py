@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming line profiles computed inside the integration loop.
+
+After every frame, SpectrumStream.add computes the cloud luminosities, the
+LoS velocities for every inclination and the binned, smoothed profile, and
+writes them as one row of a memory-mapped (frame, velocity_bin, inclination)
+cube on disk. No snapshot is kept, so memory use does not grow with Nimg;
+full-resolution states are only written to archive.bin at the requested
+timesteps, as before.
+
+The global velocity range of the post-processing pass is not known until
+the run ends, so the bins are fixed up front. By default they span the
+escape speed at the inner cloud radius plus the kick speed, which no bound
+cloud can exceed.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from agnbeans.projection import rotation_matrices
+
+
+STREAM_FILE = "spectra_stream.npy"
+STREAM_TIMES_FILE = "spectra_stream_times.npy"
+STREAM_INDEX_FILE = "spectra_stream.json"
+
+
+def default_velocity_range(BHMg, r_inner, vkick, G=6.674e-8, padding=0.1):
+    """
+    Symmetric LoS velocity range that holds every bound cloud: the escape
+    speed at r_inner plus the kick speed, expanded by padding.
+    """
+    vmax = (1 + padding) * (np.sqrt(2 * G * BHMg / r_inner) + vkick)
+    return (-vmax, vmax)
+
+
+def smoothing_kernel(stddev):
+    """
+    The normalised Gaussian1DKernel used for the post-processed profiles.
+    """
+    from astropy.convolution import Gaussian1DKernel
+    kernel = Gaussian1DKernel(stddev=stddev).array
+    return kernel / kernel.sum()
+
+
+def bin_profiles(LoS, Lvals, vel_range, numbin, kernel):
+    """
+    Sums the luminosities Lvals (N,) into numbin bins over vel_range for
+    the (K, N) LoS velocities of K inclinations in one bincount, and
+    smooths each profile with kernel.
+
+    Returns the (numbin, K) profiles.
+    """
+    lo, hi = vel_range
+    width = (hi - lo) / numbin
+    K = len(LoS)
+
+    idx = np.floor((LoS - lo) / width).astype(np.int64)
+    # Same closed right edge as binned_statistic
+    idx[LoS == hi] = numbin - 1
+    inside = (idx >= 0) & (idx < numbin)
+    flat = (idx + (np.arange(K) * numbin)[:, None])[inside]
+    weights = np.broadcast_to(Lvals, LoS.shape)[inside]
+
+    Lsum = np.bincount(flat, weights=weights, minlength=K * numbin).reshape(K, numbin)
+    for k in range(K):
+        Lsum[k] = np.convolve(Lsum[k], kernel, mode='same')
+
+    return Lsum.T
+
+
+class SpectrumStream:
+    """
+    Appends one smoothed line profile per inclination for every frame to
+    out_dir/spectra_stream.npy. luminosity is a function of the (N+1, 6)
+    phase space array that returns the N cloud luminosities.
+    """
+
+    def __init__(self, out_dir, n_frames, inclinations, vel_range, luminosity,
+                 numbin=40, stddev=0.5, resume=False):
+        self.luminosity = luminosity
+        self.inclinations = list(inclinations)
+        self.numbin = numbin
+        self.vel_range = vel_range
+        self.los_rows = rotation_matrices(self.inclinations)[:, 2, :]     # (K, 3)
+        self.kernel = smoothing_kernel(stddev)
+
+        edges = np.linspace(vel_range[0], vel_range[1], numbin + 1)
+        self.velocity = 0.5 * (edges[1:] + edges[:-1])
+
+        os.makedirs(out_dir, exist_ok=True)
+        cube_path = os.path.join(out_dir, STREAM_FILE)
+        times_path = os.path.join(out_dir, STREAM_TIMES_FILE)
+        if resume and os.path.exists(cube_path):
+            self.cube = np.load(cube_path, mmap_mode='r+')
+            self.times = np.load(times_path, mmap_mode='r+')
+        else:
+            shape = (n_frames, numbin, len(self.inclinations))
+            self.cube = np.lib.format.open_memmap(cube_path, mode='w+',
+                                                  dtype=np.float64, shape=shape)
+            self.times = np.lib.format.open_memmap(times_path, mode='w+',
+                                                   dtype=np.float64, shape=(n_frames,))
+            self.times[:] = np.nan
+
+        with open(os.path.join(out_dir, STREAM_INDEX_FILE), "w") as f:
+            json.dump({'inclinations': self.inclinations,
+                       'velocity': self.velocity.tolist()}, f, indent=1)
+
+    def profiles(self, coords):
+        """
+        Returns the (numbin, K) smoothed profiles of one phase space array.
+        """
+        Lvals = self.luminosity(coords)
+        LoS = self.los_rows @ coords[1:, 3:].T                  # (K, N)
+        return bin_profiles(LoS, Lvals, self.vel_range, self.numbin, self.kernel)
+
+    def add(self, frame, t, coords):
+        """
+        Computes and stores the profiles of one frame.
+        """
+        self.cube[frame] = self.profiles(coords)
+        self.times[frame] = t
+
+    def close(self):
+        self.cube.flush()
+        self.times.flush()
+
+
+def open_stream(out_dir):
+    """
+    Opens a finished stream read-only.
+
+    Returns (times, velocity, inclinations, cube).
+    """
+    with open(os.path.join(out_dir, STREAM_INDEX_FILE)) as f:
+        index = json.load(f)
+    cube = np.load(os.path.join(out_dir, STREAM_FILE), mmap_mode='r')
+    times = np.load(os.path.join(out_dir, STREAM_TIMES_FILE), mmap_mode='r')
+    return times, np.array(index['velocity']), index['inclinations'], cube
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parameter space sweeps.
+
+A grid of black hole masses, kick speeds and kick angles is expanded into
+cells (3x3x3 = 27 for the ParameterSpaceOverview matrix). Each cell runs the
+simulate, extract and spectra stages in its own folder under the sweep
+folder, in a process pool with one worker per core. manifest.json records
+the status, wall time and output folder of every cell and is rewritten after
+each cell finishes, so an interrupted sweep picks up where it stopped and
+only re-runs cells that are not done.
+"""
+
+import itertools
+import json
+import os
+import shutil
+import time
+import traceback
+from concurrent.futures import as_completed
+
+from agnbeans import pipeline
+from agnbeans.checkpoint import has_checkpoint
+from agnbeans.config import RunConfig
+from agnbeans.parallel import process_pool
+
+
+MANIFEST_FILE = "manifest.json"
+
+# The matrix from ParameterSpace/ParameterSpaceOverview
+DEFAULT_GRID = {
+    'BHM': [5e6, 5e7, 5e8],             # Solar masses
+    'kick': [1000e5, 2000e5, 3000e5],   # cm/s
+    'angle': [0, 13, 45],               # Degrees from the z axis
+}
+
+
+def cell_name(BHM, kick, angle):
+    """
+    Folder name of a cell in the ParameterSpaceOverview style, e.g. 3k_45deg_5e8.
+    """
+    exponent = int(f"{BHM:e}".split("e")[1])
+    mantissa = f"{BHM / 10**exponent:g}"
+    return f"{kick / 1e8:g}k_{angle:g}deg_{mantissa}e{exponent}"
+
+
+def expand_grid(grid):
+    """
+    Returns one {'name', 'BHM', 'kick', 'angle'} dict per grid cell.
+    """
+    cells = []
+    for BHM, kick, angle in itertools.product(grid['BHM'], grid['kick'], grid['angle']):
+        cells.append({'name': cell_name(BHM, kick, angle),
+                      'BHM': BHM, 'kick': kick, 'angle': angle})
+    return cells
+
+
+def run_cell(cell, base_params, out_root):
+    """
+    Runs one cell in out_root/<name>, continuing its integration from a
+    checkpoint if an earlier attempt was interrupted. Returns its manifest
+    record.
+    """
+    out_dir = os.path.join(out_root, cell['name'])
+    resume = has_checkpoint(pipeline.checkpoint_dir(out_dir))
+    if os.path.exists(out_dir) and not resume:
+        shutil.rmtree(out_dir)    # Partial output of an interrupted run
+
+    start = time.time()
+    record = {'params': cell, 'output': out_dir}
+    try:
+        cfg = RunConfig.from_kick(cell['kick'], cell['angle'], BHM=cell['BHM'], **base_params)
+        pipeline.simulate(cfg, out_dir, resume=resume)
+        pipeline.extract(cfg, out_dir)
+        record['spectra'] = pipeline.spectra(cfg, out_dir)
+        record['status'] = 'done'
+    except Exception:
+        record['status'] = 'failed'
+        record['error'] = traceback.format_exc()
+    record['wall_time'] = time.time() - start
+
+    return record
+
+
+def load_manifest(out_root):
+    path = os.path.join(out_root, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(out_root, manifest):
+    """
+    Writes the manifest atomically so an interruption never leaves it half
+    written.
+    """
+    path = os.path.join(out_root, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def run_sweep(out_root, grid=None, base_params=None, workers=None):
+    """
+    Runs every cell of grid (DEFAULT_GRID if None) that is not already done
+    in out_root. base_params are passed to RunConfig for every cell, e.g.
+    {'N_testparticle': 5000}. workers defaults to the number of cores.
+
+    Returns the manifest.
+    """
+    grid = grid or DEFAULT_GRID
+    base_params = base_params or {}
+    os.makedirs(out_root, exist_ok=True)
+
+    manifest = load_manifest(out_root)
+    todo = []
+    for cell in expand_grid(grid):
+        if manifest.get(cell['name'], {}).get('status') == 'done':
+            continue
+        manifest[cell['name']] = {'params': cell, 'status': 'pending'}
+        todo.append(cell)
+    save_manifest(out_root, manifest)
+
+    print(f"{len(todo)} of {len(manifest)} cells to run")
+    if not todo:
+        return manifest
+
+    with process_pool(workers) as pool:
+        futures = {pool.submit(run_cell, cell, base_params, out_root): cell for cell in todo}
+        for future in as_completed(futures):
+            record = future.result()
+            manifest[record['params']['name']] = record
+            save_manifest(out_root, manifest)
+            print(f"{record['params']['name']}: {record['status']} "
+                  f"in {record['wall_time']:.1f} s")
+
+    return manifest
+
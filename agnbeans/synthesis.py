@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spectrum synthesis on fine velocity grids.
+
+synthesize deposits the luminosity of every cloud onto the velocity grid
+of every snapshot and inclination with bincount, then smooths all
+profiles together. A cloud is deposited with
+
+    'ngp'   its whole luminosity in the bin it falls in, as
+            stats.binned_statistic does
+    'cic'   its luminosity split linearly between the two nearest bin
+            centres, which is much less noisy when bins are narrower than
+            the spacing of the clouds
+
+and is broadened by a Gaussian of stddev bins (the instrumental smoothing
+of spectra.line_profile) plus, in quadrature, its own thermal or turbulent
+velocity width sigma in cm/s. Clouds with different widths are grouped
+into logarithmic width classes, each class is deposited on its own
+grid and smoothed with one kernel, so per-cloud broadening costs a handful
+of convolutions instead of one Gaussian per cloud. Short kernels are
+applied directly with scipy.ndimage.convolve1d, long ones through an FFT,
+so the cost grows as numbin log numbin and grids of thousands of bins stay
+cheap. With 'ngp', stddev=0.5 and no sigma the profiles are those of
+line_profile.
+"""
+
+import numpy as np
+
+
+DEPOSITIONS = ('ngp', 'cic')
+
+K_B = 1.380649e-16              # Boltzmann constant erg/K
+M_U = 1.66053907e-24            # Atomic mass unit g
+
+DIRECT_KERNEL = 63              # Longest kernel convolved directly, FFT above
+
+
+def thermal_width(T, mass=1.00794, turbulence=0.0):
+    """
+    One dimensional velocity dispersion in cm/s of gas at temperature T of
+    an emitter of the given mass in amu, plus a turbulent dispersion in
+    quadrature.
+    """
+    return np.sqrt(K_B * np.asarray(T) / (mass * M_U) + np.asarray(turbulence)**2)
+
+
+def gaussian_kernel(sigma):
+    """
+    Kernel of a Gaussian with sigma bins sampled at bin centres out to
+    4 sigma and normalised to 1, the same as astropy's Gaussian1DKernel for
+    stddev=0.5, or [1] for sigma 0.
+    """
+    if sigma <= 0:
+        return np.ones(1)
+    half = max(int(np.ceil(4 * sigma)), 1)
+    x = np.arange(-half, half + 1)
+    kernel = np.exp(-0.5 * (x / sigma)**2)
+    return kernel / kernel.sum()
+
+
+def smooth(profiles, kernel, axis=-1):
+    """
+    Convolves every profile along axis with the odd length kernel, zero
+    outside the grid, like np.convolve(..., mode='same').
+    """
+    if len(kernel) == 1:
+        return profiles * kernel[0]
+    if len(kernel) <= DIRECT_KERNEL:
+        from scipy import ndimage
+        return ndimage.convolve1d(profiles, kernel, axis=axis, mode='constant', cval=0.0)
+
+    profiles = np.moveaxis(profiles, axis, -1)
+    n, half = profiles.shape[-1], len(kernel) // 2
+    size = 1 << int(np.ceil(np.log2(n + len(kernel) - 1)))
+    out = np.fft.irfft(np.fft.rfft(profiles, size) * np.fft.rfft(kernel, size), size)
+    return np.moveaxis(out[..., half:half + n], -1, axis)
+
+
+def velocity_grid(vel_ranges, numbin):
+    """
+    Bin centres (K, numbin) of one range per inclination.
+    """
+    ranges = np.asarray(vel_ranges, dtype=float).reshape(-1, 2)
+    width = (ranges[:, 1] - ranges[:, 0]) / numbin
+    return ranges[:, :1] + width[:, None] * (np.arange(numbin) + 0.5)
+
+
+def _deposit(LoS, lo, hi, numbin, deposition):
+    """
+    Bin indices and fractions of the LoS velocities: a list of (index,
+    fraction) pairs with the overflow index numbin for clouds outside the
+    range.
+    """
+    width = (hi - lo) / numbin
+    if deposition == 'ngp':
+        idx = np.floor((LoS - lo) / width).astype(np.int64)
+        # Same closed right edge as binned_statistic
+        idx[LoS == hi] = numbin - 1
+        idx[(idx < 0) | (idx > numbin)] = numbin
+        return [(idx, 1.0)]
+
+    u = (LoS - lo) / width - 0.5
+    left = np.floor(u)
+    frac = u - left
+    left = left.astype(np.int64)
+    outside = (LoS < lo) | (LoS > hi)
+    # Clouds within half a bin of either edge keep all of their luminosity
+    right = np.where(outside, numbin, np.minimum(left + 1, numbin - 1))
+    left = np.where(outside, numbin, np.maximum(left, 0))
+    return [(left, 1 - frac), (right, frac)]
+
+
+def _width_classes(sigma, bin_widths, stddev, classes):
+    """
+    Width class of every cloud and the total kernel stddev in bins of each
+    class and inclination, (C, K). Class 0 holds clouds without a width of
+    their own, the others split the positive widths logarithmically.
+    """
+    if np.ptp(sigma) == 0:
+        cls = np.zeros(sigma.shape, dtype=np.int64)
+        widths = sigma.flat[:1]
+    else:
+        positive = sigma[sigma > 0]
+        edges = np.geomspace(positive.min(), positive.max(), classes + 1)
+        cls = np.clip(np.searchsorted(edges, sigma, side='right') - 1, 0, classes - 1) + 1
+        cls[sigma <= 0] = 0
+        widths = np.concatenate([[0.0], np.sqrt(edges[1:] * edges[:-1])])
+    return cls, np.sqrt(stddev**2 + (widths[:, None] / bin_widths[None, :])**2)
+
+
+def synthesize(LoS, Lvals, vel_ranges, numbin=40, deposition='ngp', stddev=0.5,
+               sigma=None, classes=16, chunk=None):
+    """
+    Line profiles of every snapshot, line and inclination.
+
+    LoS is (S, K, N) or (K, N), vel_ranges one (lo, hi) per inclination and
+    Lvals (S, N), (S, L, N) for L emission lines, or (N,) for one snapshot.
+    sigma is the velocity width in cm/s of each cloud, a scalar, (N,) or
+    (S, N). chunk limits how many snapshots are binned at once.
+
+    Returns (velocity (K, numbin) bin centres, profiles (S, K, numbin), or
+    (S, L, K, numbin) with lines, without the S axis when LoS is (K, N)).
+    """
+    if deposition not in DEPOSITIONS:
+        raise ValueError(f"Unknown deposition {deposition!r}, use one of {DEPOSITIONS}")
+    single = np.ndim(LoS) == 2
+    LoS = np.asarray(LoS)[None] if single else np.asarray(LoS)
+    S, K, N = LoS.shape
+    Lvals = np.asarray(Lvals, dtype=float)
+    lines = Lvals.ndim == 3 or (single and Lvals.ndim == 2)
+    Lvals = Lvals.reshape(S, -1, N)                                      # (S, L, N)
+    L = Lvals.shape[1]
+
+    ranges = np.asarray(vel_ranges, dtype=float).reshape(K, 2)
+    bin_widths = (ranges[:, 1] - ranges[:, 0]) / numbin
+    sigma = np.broadcast_to(np.asarray(0.0 if sigma is None else sigma, dtype=float), (S, N))
+    cls, kernels = _width_classes(sigma, bin_widths, stddev, classes)
+    C = len(kernels)
+
+    # Keep the deposition grids to about 64 MB
+    chunk = chunk or max(1, min(S, 2**23 // (C * L * K * numbin)))
+    profiles = np.empty((S, L, K, numbin))
+    lo, hi = ranges[:, :1], ranges[:, 1:]
+    for start in range(0, S, chunk):
+        stop = min(start + chunk, S)
+        n = stop - start
+        # Flat index of (class, snapshot, line, inclination, bin), with one
+        # overflow bin per profile for the clouds outside its range
+        stride = numbin + 1
+        slot = ((np.arange(n)[:, None, None] * L + np.arange(L)[None, :, None]) * K
+                + np.arange(K)[None, None, :]) * stride                  # (n, L, K)
+        shape = (n, L, K, N)
+
+        grid = np.zeros(C * n * L * K * stride)
+        for idx, frac in _deposit(LoS[start:stop], lo, hi, numbin, deposition):
+            flat = idx[:, None] + slot[..., None]                        # (n, L, K, N)
+            if C > 1:
+                flat += (cls[start:stop] * (n * L * K * stride))[:, None, None, :]
+            weights = Lvals[start:stop, :, None, :] * (frac[:, None] if np.ndim(frac) else frac)
+            grid += np.bincount(flat.ravel(), weights=np.broadcast_to(weights, shape).ravel(),
+                                minlength=grid.size)
+        grid = grid.reshape(C, n, L, K, stride)[..., :numbin]
+
+        out = np.zeros((n, L, K, numbin))
+        for c in range(C):
+            if not grid[c].any():
+                continue
+            # Inclinations with the same bin width share one convolution
+            for width in np.unique(kernels[c]):
+                ks = np.flatnonzero(kernels[c] == width)
+                out[:, :, ks] += smooth(grid[c][:, :, ks], gaussian_kernel(width))
+        profiles[start:stop] = out
+
+    if not lines:
+        profiles = profiles[:, 0]
+    return velocity_grid(ranges, numbin), profiles[0] if single else profiles
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stage timing, memory use and integrator telemetry.
+
+Telemetry writes one JSON object per line to telemetry.jsonl:
+
+    stage   wall time, peak traced memory and peak RSS of one pipeline
+            stage (INTEGRATION, DATA EXTRACTION, COMBINED PLOT)
+    step    frame, sim.t, the step just taken (sim.dt_last_done), the next
+            step IAS15 proposes (sim.dt) and the wall time of the frame,
+            with clamped set when the step taken was held at
+            sim.ri_ias15.min_dt instead of the smaller one IAS15 wanted
+    summary step counts and clamped frames, written by close()
+
+Peak traced memory comes from tracemalloc, which sees numpy arrays but not
+memory allocated inside REBOUND and slows every allocation down, so it is
+only recorded with trace_memory=True; peak RSS covers the whole process but
+never goes down, so it is the peak so far. With profile='cprofile' each
+stage is run under cProfile and its stats saved to {stage}.prof (read them
+with pstats or snakeviz); profile='pyinstrument' saves a sampling profile
+to {stage}.html instead.
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:             # Windows
+    resource = None
+
+
+TELEMETRY_FILE = "telemetry.jsonl"
+
+
+def peak_rss():
+    """
+    Peak resident memory of this process in bytes, or None if unknown.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _file_name(stage):
+    return stage.lower().replace(" ", "_")
+
+
+class Telemetry:
+    """
+    Structured log for one run in out_dir/telemetry.jsonl. With
+    resume=True new records are appended to an existing log.
+    """
+
+    def __init__(self, out_dir, profile=None, trace_memory=False, resume=False):
+        if profile not in (None, 'cprofile', 'pyinstrument'):
+            raise ValueError(f"Unknown profiler {profile!r}")
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.file = open(os.path.join(out_dir, TELEMETRY_FILE), "a" if resume else "w")
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.n_steps = 0
+        self.clamped = []
+
+    def record(self, event, **fields):
+        """
+        Writes one record, stamped with the seconds since the log was opened.
+        """
+        fields = dict(event=event, elapsed=time.perf_counter() - self.start, **fields)
+        self.file.write(json.dumps(fields) + "\n")
+
+    # Stages ------------------------------------------------------------------
+
+    def begin(self, stage):
+        """
+        Starts timing stage. Scripts that cannot indent a whole cell under
+        a with block call begin and end instead of using stage().
+        """
+        profiler = None
+        if self.profile == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        elif self.profile == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        self.stages[stage] = (time.perf_counter(), profiler)
+
+    def end(self, stage):
+        """
+        Stops timing stage and records it.
+
+        Returns the stage record.
+        """
+        start, profiler = self.stages.pop(stage)
+        wall = time.perf_counter() - start
+
+        peak_traced = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            peak_traced = tracemalloc.get_traced_memory()[1]
+            if not self.stages:
+                tracemalloc.stop()
+
+        if self.profile == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(os.path.join(self.out_dir, _file_name(stage) + ".prof"))
+        elif self.profile == 'pyinstrument':
+            profiler.stop()
+            with open(os.path.join(self.out_dir, _file_name(stage) + ".html"), "w") as f:
+                f.write(profiler.output_html())
+
+        fields = dict(stage=stage, wall=wall, peak_traced=peak_traced, peak_rss=peak_rss())
+        self.record('stage', **fields)
+        self.file.flush()
+        return fields
+
+    @contextmanager
+    def stage(self, stage):
+        self.begin(stage)
+        try:
+            yield self
+        finally:
+            self.end(stage)
+
+    # Integration -------------------------------------------------------------
+
+    def step(self, frame, sim, wall):
+        """
+        Records one frame (a sim.step(), or a sim.integrate() to the next
+        output time) that took wall seconds.
+        """
+        dt_done = sim.dt_last_done
+        clamped = False
+        if sim.integrator == "ias15":
+            min_dt = sim.ri_ias15.min_dt
+            # IAS15 sets the step to exactly min_dt when it wants a smaller one
+            clamped = bool(min_dt > 0 and abs(abs(dt_done) - min_dt) <= 1e-12 * min_dt)
+        if clamped:
+            self.clamped.append(frame)
+        self.n_steps += 1
+        self.record('step', frame=frame, t=sim.t, dt_done=dt_done, dt=sim.dt,
+                    wall=wall, clamped=clamped)
+
+    def close(self):
+        """
+        Writes the summary and closes the log.
+        """
+        for stage in list(self.stages):
+            self.end(stage)
+        self.record('summary', steps=self.n_steps, clamped_steps=len(self.clamped),
+                    first_clamped=self.clamped[0] if self.clamped else None,
+                    last_clamped=self.clamped[-1] if self.clamped else None)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_telemetry(out_dir):
+    """
+    Reads a telemetry log.
+
+    Returns (stages, steps): stages is the list of stage records, steps a
+    dict of arrays (frame, t, dt_done, dt, wall, clamped) over every
+    recorded step.
+    """
+    stages, steps = [], []
+    with open(os.path.join(out_dir, TELEMETRY_FILE)) as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry['event'] == 'stage':
+                stages.append(entry)
+            elif entry['event'] == 'step':
+                steps.append(entry)
+
+    names = ['frame', 't', 'dt_done', 'dt', 'wall', 'clamped']
+    return stages, {name: np.array([entry[name] for entry in steps]) for name in names}
@@ -0,0 +1,110 @@
+"""
+Checks the ProductCache lookups, stale entry invalidation and eviction
+order, and that run_cached only recomputes the stages whose keys changed.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from agnbeans.cache import ProductCache, digest
+from agnbeans.config import RunConfig
+from agnbeans.pipeline import run_cached, stage_keys
+
+
+def write_entry(cache, key, stage, size, accessed=None):
+    with cache.put(key, stage) as tmp:
+        with open(os.path.join(tmp, "data.bin"), "wb") as f:
+            f.write(b"x" * size)
+    if accessed is not None:
+        os.utime(os.path.join(cache.path(key), "meta.json"), (accessed, accessed))
+
+
+def test_hit_and_miss(tmp_path):
+    cache = ProductCache(str(tmp_path))
+    key = digest('extract', {'numbin': 40})
+    assert cache.get(key) is None
+    write_entry(cache, key, 'extract', 10)
+    assert cache.get(key) == cache.path(key)
+    assert cache.get(digest('extract', {'numbin': 41})) is None
+    assert cache.get(digest('extract', {'numbin': 40}, [key])) is None
+
+
+def test_keys_follow_params():
+    keys = stage_keys(RunConfig(N_testparticle=10))
+    # Post-processing parameters keep the integration
+    post = stage_keys(RunConfig(N_testparticle=10, ObsInc=[0, 30]))
+    assert post['simulate'] == keys['simulate'] and post['luminosity'] == keys['luminosity']
+    assert post['spectra'] != keys['spectra']
+    # An integration parameter changes every product computed from it
+    mass = stage_keys(RunConfig(N_testparticle=10, BHM=5e7))
+    assert all(mass[stage] != keys[stage] for stage in keys)
+
+
+def test_stale_entry_invalidated(tmp_path):
+    cache = ProductCache(str(tmp_path))
+    key = digest('extract')
+    write_entry(cache, key, 'extract', 10)
+    with open(os.path.join(cache.path(key), "data.bin"), "wb") as f:
+        f.write(b"x" * 5)      # A truncated copy
+    assert cache.get(key) is None
+    assert not os.path.exists(cache.path(key))
+    assert cache.entries() == []
+
+
+def test_lru_order(tmp_path):
+    cache = ProductCache(str(tmp_path), max_bytes=10**6)
+    keys = [digest('spectra', {'i': i}) for i in range(4)]
+    for i, key in enumerate(keys):
+        write_entry(cache, key, 'spectra', 100, accessed=1000 + i)
+    assert [entry['key'] for entry in cache.entries()] == keys
+
+    # A hit makes the oldest entry the newest
+    cache.get(keys[0])
+    assert cache.evict(max_bytes=200) == keys[1:3]
+    assert sorted(entry['key'] for entry in cache.entries()) == sorted([keys[0], keys[3]])
+
+
+def test_simulate_evicted_last(tmp_path):
+    cache = ProductCache(str(tmp_path), max_bytes=10**6)
+    archive = digest('simulate')
+    write_entry(cache, archive, 'simulate', 300, accessed=1000)
+    others = [digest('spectra', {'i': i}) for i in range(3)]
+    for i, key in enumerate(others):
+        write_entry(cache, key, 'spectra', 100, accessed=2000 + i)
+
+    assert cache.evict(max_bytes=500) == others[:1]
+    assert cache.evict(max_bytes=300) == others[1:]
+    assert cache.evict(max_bytes=0) == [archive]
+
+
+def test_run_cached_reuses_products(tmp_path):
+    pytest.importorskip("astropy")
+    pytest.importorskip("scipy")
+    cache = ProductCache(str(tmp_path / "cache"))
+    cfg = RunConfig(N_testparticle=20, Nimg=6, timesteps=[0, 2, 5])
+    run = str(tmp_path / "run")
+
+    first = run_cached(cfg, run, cache, log=None)
+    assert set(first.values()) == {'computed'}
+    spectrum = np.loadtxt(os.path.join(run, "TimestepData", "ProcessedSpectra", "t2.csv"),
+                          delimiter=",", skiprows=1)
+
+    assert set(run_cached(cfg, run, cache, log=None).values()) == {'cached'}
+
+    # Only the spectra depend on ObsInc
+    status = run_cached(RunConfig(N_testparticle=20, Nimg=6, timesteps=[0, 2, 5],
+                                  ObsInc=[0, 45]), run, cache, log=None)
+    assert status == {'simulate': 'cached', 'extract': 'cached',
+                      'luminosity': 'cached', 'spectra': 'computed'}
+
+    # With the archive evicted the cached cube is used without integrating
+    cache.invalidate(stage_keys(cfg)['simulate'])
+    status = run_cached(cfg, run, cache, log=None)
+    assert status == {'simulate': 'skipped', 'extract': 'cached',
+                      'luminosity': 'cached', 'spectra': 'cached'}
+    assert not os.path.exists(os.path.join(run, "RawData", "archive.bin"))
+    np.testing.assert_array_equal(
+        np.loadtxt(os.path.join(run, "TimestepData", "ProcessedSpectra", "t2.csv"),
+                   delimiter=",", skiprows=1), spectrum)
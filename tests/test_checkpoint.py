@@ -0,0 +1,51 @@
+"""
+Checks that a run interrupted after a checkpoint and resumed from it writes
+the same archive, bit for bit, as a run that never stopped.
+"""
+
+import numpy as np
+import pytest
+
+from agnbeans.checkpoint import has_checkpoint
+from agnbeans.config import RunConfig
+from agnbeans.extraction import extract_archive
+from agnbeans.simulation import run_simulation
+
+
+class Interrupt(Exception):
+    pass
+
+
+class StopAt:
+    """
+    Stands in for a SpectrumStream and interrupts the run at frame stop.
+    """
+
+    def __init__(self, stop):
+        self.stop = stop
+
+    def add(self, i, t, coords):
+        if i == self.stop:
+            raise Interrupt
+
+
+def test_resume_is_bit_identical(tmp_path):
+    cfg = RunConfig.from_kick(2000e5, 45, BHM=5e7, N_testparticle=25, Nimg=12,
+                              timesteps=[0, 1, 4, 6, 7, 9, 11])
+    reference = str(tmp_path / "reference.bin")
+    run_simulation(cfg, reference)
+
+    archive = str(tmp_path / "archive.bin")
+    checkpoint_dir = str(tmp_path / "checkpoint")
+    # Frames 6 and 7 are saved after the checkpoint at frame 6 and run again
+    with pytest.raises(Interrupt):
+        run_simulation(cfg, archive, checkpoint_dir=checkpoint_dir, checkpoint_every=3,
+                       stream=StopAt(8))
+    assert has_checkpoint(checkpoint_dir)
+    run_simulation(cfg, archive, checkpoint_dir=checkpoint_dir, checkpoint_every=3, resume=True)
+
+    cube, times = extract_archive(archive, str(tmp_path / "raw"))
+    expected, expected_times = extract_archive(reference, str(tmp_path / "raw_reference"))
+    assert cube.shape == (len(cfg.timesteps), 26, 6)
+    np.testing.assert_array_equal(cube, expected)
+    np.testing.assert_array_equal(times, expected_times)
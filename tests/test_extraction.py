@@ -0,0 +1,104 @@
+"""
+Checks that extract_archive reads every snapshot of a Simulationarchive into
+the phase-space cube and that TimestepStore round-trips the cube and derived
+columns.
+"""
+
+import os
+
+import numpy as np
+import pytest
+import rebound
+
+from agnbeans.config import RunConfig
+from agnbeans.extraction import extract_archive, open_cube
+from agnbeans.simulation import build_simulation
+from agnbeans.store import PHASE_COLUMNS, TimestepStore
+
+
+def write_archive(path, n_snapshots=4):
+    """
+    Archive of a small cloud and the coordinates of every snapshot read
+    particle by particle, the way the scripts used to.
+    """
+    sim = build_simulation(RunConfig(N_testparticle=25, BHM=5e7))
+    expected, times = [], []
+    for k in range(n_snapshots):
+        sim.integrate(1e8 * (k + 1), exact_finish_time=1)
+        sim.save_to_file(path)
+        expected.append([[p.x, p.y, p.z, p.vx, p.vy, p.vz] for p in sim.particles])
+        times.append(sim.t)
+    return np.array(expected), np.array(times)
+
+
+def test_extract_archive(tmp_path):
+    archive = str(tmp_path / "archive.bin")
+    expected, times = write_archive(archive)
+
+    cube, save_times = extract_archive(archive, str(tmp_path / "raw"))
+    np.testing.assert_array_equal(cube, expected)
+    np.testing.assert_array_equal(save_times, times)
+
+    reopened, reopened_times = open_cube(str(tmp_path / "raw"))
+    np.testing.assert_array_equal(reopened, expected)
+    np.testing.assert_array_equal(reopened_times, times)
+
+
+def test_extract_rejects_changing_particle_count(tmp_path):
+    archive = str(tmp_path / "archive.bin")
+    sim = rebound.Simulation()
+    sim.add(m=1.0)
+    sim.add(m=0.0, a=1.0)
+    sim.save_to_file(archive)
+    sim.add(m=0.0, a=2.0)
+    sim.save_to_file(archive)
+    with pytest.raises(ValueError):
+        extract_archive(archive, str(tmp_path / "raw"))
+
+
+def test_store_round_trip(tmp_path):
+    archive = str(tmp_path / "archive.bin")
+    expected, times = write_archive(archive)
+    cube, save_times = extract_archive(archive, str(tmp_path / "raw"))
+
+    path = str(tmp_path / "store")
+    store = TimestepStore.create(path, cube, save_times)
+    assert store.n_particles == expected.shape[1] - 1
+    np.testing.assert_array_equal(store.steps, np.arange(len(times)))
+
+    # Test particles only, the central mass is dropped
+    for step in store.steps:
+        data = store.read(step)
+        for k, name in enumerate(PHASE_COLUMNS):
+            np.testing.assert_array_equal(data[name], expected[step, 1:, k])
+
+    store.add_column('Luminosity')
+    store.write('Luminosity', 2, np.arange(store.n_particles, dtype=float))
+
+    reopened = TimestepStore(path)
+    np.testing.assert_array_equal(reopened.times, times)
+    assert reopened.columns == PHASE_COLUMNS + ['Luminosity']
+    np.testing.assert_array_equal(reopened.read(2, ['Luminosity'])['Luminosity'],
+                                  np.arange(store.n_particles))
+    assert np.all(np.isnan(reopened.column('Luminosity')[0]))
+    with pytest.raises(KeyError):
+        reopened.column('Missing')
+
+    # A new store in the same folder drops the derived columns of the old one
+    recreated = TimestepStore.create(path, cube, save_times)
+    assert recreated.columns == PHASE_COLUMNS
+    assert not os.path.exists(os.path.join(path, "Luminosity.npy"))
+
+
+def test_store_csv_export(tmp_path):
+    pd = pytest.importorskip("pandas")
+    archive = str(tmp_path / "archive.bin")
+    expected, _ = write_archive(archive, n_snapshots=2)
+    cube, save_times = extract_archive(archive, str(tmp_path / "raw"))
+    store = TimestepStore.create(str(tmp_path / "store"), cube, save_times)
+
+    store.export_csv(str(tmp_path / "csv"))
+    frame = pd.read_csv(str(tmp_path / "csv" / "t1.csv"), index_col=0)
+    assert list(frame.columns) == PHASE_COLUMNS
+    # Text keeps 16 significant digits
+    np.testing.assert_allclose(frame.to_numpy(), expected[1, 1:], rtol=1e-15)
@@ -0,0 +1,60 @@
+"""
+Checks that add_cloud builds the same particles as adding them one by one
+with sim.add, from Cartesian coordinates and from orbital elements.
+"""
+
+import numpy as np
+import rebound
+
+from agnbeans.config import RunConfig
+from agnbeans.initial import add_cloud, cloud_coordinates, initial_elements
+
+
+def central_mass(cfg):
+    sim = rebound.Simulation()
+    sim.units = ('s', 'cm', 'g')
+    # Off the origin and moving, so the offset to particle 0 is tested
+    sim.add(m=cfg.BHMg, x=3e14, y=-2e14, z=1e14, vx=1e6, vy=2e6, vz=-3e6)
+    return sim
+
+
+def state(sim):
+    coords = np.zeros((sim.N, 6))
+    sim.serialize_particle_data(xyzvxvyvz=coords)
+    masses = np.array([p.m for p in sim.particles])
+    return coords, masses
+
+
+def test_add_cloud_matches_sim_add():
+    cfg = RunConfig(N_testparticle=50, BHM=5e7)
+    sim = central_mass(cfg)
+    coords = cloud_coordinates(cfg, sim.G)
+    add_cloud(sim, coords)
+
+    reference = central_mass(cfg)
+    p0 = reference.particles[0]
+    for x, y, z, vx, vy, vz in coords:
+        reference.add(m=0, x=p0.x + x, y=p0.y + y, z=p0.z + z,
+                      vx=p0.vx + vx, vy=p0.vy + vy, vz=p0.vz + vz)
+
+    assert sim.N == reference.N == cfg.N_testparticle + 1
+    coords, masses = state(sim)
+    expected, expected_masses = state(reference)
+    np.testing.assert_array_equal(coords, expected)
+    np.testing.assert_array_equal(masses, expected_masses)
+
+
+def test_add_cloud_matches_orbital_elements():
+    cfg = RunConfig(N_testparticle=50, BHM=5e7)
+    sim = central_mass(cfg)
+    add_cloud(sim, cloud_coordinates(cfg, sim.G))
+
+    reference = central_mass(cfg)
+    for a, inc, Omega, f in zip(*initial_elements(cfg)):
+        reference.add(m=0, primary=reference.particles[0], a=a, inc=inc, Omega=Omega, f=f)
+
+    coords, _ = state(sim)
+    expected, _ = state(reference)
+    np.testing.assert_allclose(coords[:, :3], expected[:, :3], rtol=0, atol=1e-12 * cfg.Rd)
+    v_scale = np.max(np.abs(expected[1:, 3:]))
+    np.testing.assert_allclose(coords[:, 3:], expected[:, 3:], rtol=0, atol=1e-12 * v_scale)
@@ -0,0 +1,59 @@
+"""
+Checks that the spectra SpectrumStream writes inside the integration loop
+match spectra.line_profile on the archived snapshots, bin for bin.
+"""
+
+import numpy as np
+import pytest
+
+from agnbeans.config import RunConfig
+from agnbeans.extraction import extract_archive
+from agnbeans.projection import los_velocities
+from agnbeans.simulation import run_simulation
+from agnbeans.spectra import line_profile
+from agnbeans.streaming import SpectrumStream, bin_profiles, default_velocity_range, \
+    open_stream, smoothing_kernel
+
+pytest.importorskip("astropy")
+pytest.importorskip("scipy")
+
+
+INCLINATIONS = [0, 30, 57, 90]
+
+
+def luminosity(coords):
+    return 1 / np.sum(coords[1:, :3]**2, axis=1)
+
+
+def test_stream_matches_line_profile(tmp_path):
+    cfg = RunConfig.from_kick(3000e5, 45, BHM=5e7, N_testparticle=200, Nimg=8,
+                              timesteps=list(range(8)))
+    vel_range = default_velocity_range(cfg.BHMg, cfg.Rd / cfg.Y, 3000e5, G=6.67e-8)
+    stream = SpectrumStream(str(tmp_path / "stream"), cfg.n_frames, INCLINATIONS,
+                            vel_range, luminosity, numbin=40)
+    run_simulation(cfg, str(tmp_path / "archive.bin"), stream=stream)
+    stream.close()
+
+    times, velocity, inclinations, streamed = open_stream(str(tmp_path / "stream"))
+    cube, save_times = extract_archive(str(tmp_path / "archive.bin"), str(tmp_path / "raw"))
+    assert inclinations == INCLINATIONS
+    np.testing.assert_array_equal(times, save_times)
+    assert np.all(np.count_nonzero(streamed, axis=1) > 5)
+
+    for step in range(cfg.n_frames):
+        Lvals = luminosity(cube[step])
+        LoS = los_velocities(cube[step, 1:, 3:], INCLINATIONS)
+        for k in range(len(INCLINATIONS)):
+            sortedV, Lsum = line_profile(LoS[k], Lvals, vel_range, numbin=40)
+            np.testing.assert_allclose(velocity, sortedV, rtol=1e-14)
+            np.testing.assert_allclose(streamed[step, :, k], Lsum,
+                                       rtol=1e-12, atol=1e-12 * Lsum.max())
+
+
+def test_bin_profiles_edges():
+    # On the right edge, outside the range and exactly on inner edges
+    LoS = np.array([[-1.0, -0.5, 0.0, 0.25, 1.0, 1.5, -2.0]])
+    Lvals = np.arange(1.0, 8.0)
+    profile = bin_profiles(LoS, Lvals, (-1.0, 1.0), 8, smoothing_kernel(0.5))
+    _, expected = line_profile(LoS[0], Lvals, (-1.0, 1.0), numbin=8)
+    np.testing.assert_allclose(profile[:, 0], expected, rtol=1e-12, atol=1e-15)
@@ -0,0 +1,64 @@
+"""
+Checks that synthesize with nearest-bin deposition and no cloud widths
+gives the profiles of spectra.line_profile, which bins with
+stats.binned_statistic, for every snapshot, line and inclination.
+"""
+
+import numpy as np
+import pytest
+
+from agnbeans.spectra import line_profile
+from agnbeans.synthesis import synthesize
+
+pytest.importorskip("astropy")
+pytest.importorskip("scipy")
+
+
+def clouds(S, K, N, L=None, seed=0):
+    rng = np.random.default_rng(seed)
+    LoS = 3e8 * rng.normal(size=(S, K, N))
+    shape = (S, N) if L is None else (S, L, N)
+    Lvals = rng.lognormal(mean=90, sigma=1, size=shape)
+    # Clouds on the outer edges and outside the range
+    LoS[:, :, 0] = -1e9
+    LoS[:, :, 1] = 1e9
+    LoS[:, :, 2] = 2e9
+    vel_ranges = [(-1e9, 1e9), (-5e8, 8e8), (-2e9, 2e9)][:K]
+    return LoS, Lvals, vel_ranges
+
+
+@pytest.mark.parametrize("numbin", [40, 301])
+@pytest.mark.parametrize("chunk", [None, 2])
+def test_matches_line_profile(numbin, chunk):
+    LoS, Lvals, vel_ranges = clouds(S=5, K=3, N=2000)
+    velocity, profiles = synthesize(LoS, Lvals, vel_ranges, numbin=numbin, chunk=chunk)
+    assert velocity.shape == (3, numbin) and profiles.shape == (5, 3, numbin)
+
+    for s in range(5):
+        for k in range(3):
+            sortedV, Lsum = line_profile(LoS[s, k], Lvals[s], vel_ranges[k], numbin=numbin)
+            np.testing.assert_allclose(velocity[k], sortedV, rtol=1e-14)
+            np.testing.assert_allclose(profiles[s, k], Lsum, rtol=1e-12, atol=1e-12 * Lsum.max())
+
+
+def test_matches_line_profile_per_line():
+    LoS, Lvals, vel_ranges = clouds(S=3, K=2, N=1000, L=4)
+    _, profiles = synthesize(LoS, Lvals, vel_ranges)
+    assert profiles.shape == (3, 4, 2, 40)
+
+    for s in range(3):
+        for line in range(4):
+            for k in range(2):
+                _, Lsum = line_profile(LoS[s, k], Lvals[s, line], vel_ranges[k])
+                np.testing.assert_allclose(profiles[s, line, k], Lsum,
+                                           rtol=1e-12, atol=1e-12 * Lsum.max())
+
+
+def test_single_snapshot():
+    LoS, Lvals, vel_ranges = clouds(S=1, K=2, N=500)
+    velocity, profile = synthesize(LoS[0], Lvals[0], vel_ranges)
+    assert profile.shape == (2, 40)
+    for k in range(2):
+        sortedV, Lsum = line_profile(LoS[0, k], Lvals[0], vel_ranges[k])
+        np.testing.assert_allclose(velocity[k], sortedV, rtol=1e-14)
+        np.testing.assert_allclose(profile[k], Lsum, rtol=1e-12, atol=1e-12 * Lsum.max())